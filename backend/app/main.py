@@ -1,26 +1,46 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
 from contextlib import asynccontextmanager
+import os
+import asyncio
+import json
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from .database import init_db
+from .database import init_db, engine as db_engine
+from .sessions import create_session_store
 from .way_rag import WAYRAGEngine
+from .way_rag.llm import create_groq_client
 
 # Global variable to hold the brain
 rag_engine = None
+# Server-side conversation history (see sessions.py)
+session_store = None
+
+# Request-side bound on the history handed to the engine; the summary and the
+# context packer only bound the prompt, not the guard/hashing work per request
+CHAT_MAX_HISTORY_MESSAGES = int(os.getenv("CHAT_MAX_HISTORY_MESSAGES", "40"))
+CHAT_MAX_HISTORY_CHARS = int(os.getenv("CHAT_MAX_HISTORY_CHARS", "60000"))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load Model ONCE when server starts
-    global rag_engine
+    global rag_engine, session_store
     print("🚀 Booting up FastEmbed Brain...")
     init_db()
+    session_store = create_session_store(db_engine)
+    purge_task = asyncio.create_task(session_store.purge_periodically())
     rag_engine = WAYRAGEngine()
+    rag_engine.groq = create_groq_client()
     yield
     print("💤 Shutting down...")
+    purge_task.cancel()
+    session_store.flush()
+    session_store.close()
+    await rag_engine.aclose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -70,17 +90,159 @@ class ChatRequest(BaseModel):
             raise ValueError('Too many messages. Maximum is 100.')
         return v
 
+def bound_history(messages: list) -> list:
+    """
+    The most recent messages within CHAT_MAX_HISTORY_MESSAGES and
+    CHAT_MAX_HISTORY_CHARS; the last message is always kept.
+
+    The message window starts at a multiple of half its size, so it only moves
+    every few turns and summaries cached for its prefix keep matching.
+    """
+    if len(messages) > CHAT_MAX_HISTORY_MESSAGES:
+        step = max(1, CHAT_MAX_HISTORY_MESSAGES // 2)
+        start = -(-(len(messages) - CHAT_MAX_HISTORY_MESSAGES) // step) * step
+        messages = messages[start:]
+    total = 0
+    for i in range(len(messages) - 1, -1, -1):
+        total += len(messages[i]["content"])
+        if total > CHAT_MAX_HISTORY_CHARS and i < len(messages) - 1:
+            return messages[i + 1:]
+    return messages
+
 @app.post("/api/chat")
 @limiter.limit("10/minute")
 async def chat(request: Request, chat_request: ChatRequest):
     # Guard clause for empty messages (handled by Pydantic now)
-    # Token safety: limit to last 6 messages
-    messages_list = [{"role": msg.role.value, "content": msg.content} for msg in chat_request.messages]
-    chat_history = messages_list[-6:] if len(messages_list) > 6 else messages_list
+    # Token safety: the engine summarizes older turns and packs the prompt into a token budget;
+    # bound_history caps the work done on the raw history before that
+    chat_history = bound_history([{"role": msg.role.value, "content": msg.content} for msg in chat_request.messages])
     
-    # Use the pre-loaded brain with conversation context (now async)
-    response = await rag_engine.generate_answer(chat_history)
-    return {"response": response}
+    # Use the pre-loaded brain with conversation context (now async);
+    # "path" says how the answer was produced (llm, cache, faq, guard, ...),
+    # "decision" is the DecisionEngine routing (None when it could not be computed)
+    result = await rag_engine.answer(chat_history)
+    return {"response": result["response"], "path": result["path"], "decision": result.get("decision")}
+
+@app.post("/api/chat/stream")
+@limiter.limit("10/minute")
+async def chat_stream(request: Request, chat_request: ChatRequest):
+    """Same as /api/chat, but streams the answer as Server-Sent Events"""
+    chat_history = bound_history([{"role": msg.role.value, "content": msg.content} for msg in chat_request.messages])
+
+    async def event_stream():
+        async for event, data in rag_engine.stream_answer(chat_history):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class SessionCreateRequest(BaseModel):
+    # Optional seed, e.g. the assistant greeting shown before the first question
+    messages: List[ChatMessage] = []
+
+    @field_validator('messages')
+    @classmethod
+    def validate_messages(cls, v):
+        if len(v) > 100:
+            raise ValueError('Too many messages. Maximum is 100.')
+        return v
+
+class SessionMessageRequest(BaseModel):
+    content: str
+
+    @field_validator('content')
+    @classmethod
+    def validate_content(cls, v):
+        """Same rules as ChatMessage.content"""
+        if not v or not v.strip():
+            raise ValueError('Content cannot be empty or whitespace only')
+        if len(v) > 50000:  # 50KB limit per message
+            raise ValueError('Content exceeds maximum length of 50,000 characters')
+        return v.strip()
+
+# Turns that produced no answer are not kept: the guard scans earlier user
+# messages, so a stored blocked question would refuse every later turn
+UNSAVED_PATHS = {"guard", "invalid", "error"}
+
+async def get_session_or_404(session_id: str):
+    state = await session_store.get_async(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return state
+
+@app.post("/api/sessions")
+@limiter.limit("10/minute")
+async def create_session(request: Request, session_request: SessionCreateRequest = SessionCreateRequest()):
+    """Start a server-side conversation; later turns post only the new message"""
+    state = await session_store.create_async(
+        [{"role": m.role.value, "content": m.content} for m in session_request.messages]
+    )
+    return {"session_id": state.id}
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    state = await get_session_or_404(session_id)
+    return {"session_id": state.id, "messages": state.messages}
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await session_store.delete_async(session_id)
+    return {"deleted": session_id}
+
+@app.post("/api/sessions/{session_id}/messages")
+@limiter.limit("10/minute")
+async def post_session_message(request: Request, session_id: str, message: SessionMessageRequest):
+    """Same as /api/chat, with the history taken from the session"""
+    user_message = {"role": "user", "content": message.content}
+    async with session_store.lock(session_id):
+        # Fetched inside the lock: the previous turn may have changed or reloaded the session
+        state = await get_session_or_404(session_id)
+        result = await rag_engine.answer(bound_history(state.messages + [user_message]))
+        if result["path"] not in UNSAVED_PATHS:
+            await session_store.append_async(
+                session_id, [user_message, {"role": "assistant", "content": result["response"]}]
+            )
+    return {"session_id": session_id, "response": result["response"], "path": result["path"],
+            "decision": result.get("decision")}
+
+@app.post("/api/sessions/{session_id}/messages/stream")
+@limiter.limit("10/minute")
+async def post_session_message_stream(request: Request, session_id: str, message: SessionMessageRequest):
+    """Same as /api/chat/stream, with the history taken from the session"""
+    await get_session_or_404(session_id)
+    user_message = {"role": "user", "content": message.content}
+
+    async def event_stream():
+        async with session_store.lock(session_id):
+            # Fetched inside the lock: the previous turn may have changed or reloaded the session
+            state = await session_store.get_async(session_id)
+            if state is None:
+                yield f"event: error\ndata: {json.dumps({'message': 'Session not found or expired'})}\n\n"
+                return
+            parts, path = [], None
+            async for event, data in rag_engine.stream_answer(bound_history(state.messages + [user_message])):
+                if event == "token":
+                    parts.append(data["content"])
+                elif event == "done":
+                    path = data.get("path")
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            reply = "".join(parts)
+            if reply and path not in UNSAVED_PATHS:
+                await session_store.append_async(session_id, [user_message, {"role": "assistant", "content": reply}])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/metrics")
+async def metrics():
+    """Cache and latency counters of the RAG engine"""
+    return rag_engine.metrics()
 
 class SuggestionRequest(BaseModel):
     last_answer: str
@@ -90,5 +252,5 @@ async def suggest(request: SuggestionRequest):
     if not request.last_answer:
         return {"questions": []}
         
-    questions = rag_engine.generate_suggestions(request.last_answer)
+    questions = await rag_engine.generate_suggestions(request.last_answer)
     return {"questions": questions}
\ No newline at end of file
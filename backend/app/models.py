@@ -7,4 +7,10 @@ class SystemConfig(SQLModel, table=True):
     model_name: str = Field(default="gpt-4o-mini")
     temperature: float = Field(default=0.3)
     system_prompt: str = Field(default="You are a helpful assistant for Mango Inc.")
-    admin_password_hash: Optional[str] = Field(default=None)
\ No newline at end of file
+    admin_password_hash: Optional[str] = Field(default=None)
+
+class ChatSession(SQLModel, table=True):
+    """Conversation spilled out of the in-memory session store (see sessions.py)"""
+    id: str = Field(primary_key=True)
+    messages: str = Field(default="[]")  # JSON list of {"role", "content"}
+    updated_at: float = Field(default=0.0, index=True)
@@ -0,0 +1,293 @@
+"""
+Server-side chat sessions
+Clients create a session once and then post only their new message; history lives here
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlmodel import Session, select, delete
+from .models import ChatSession
+
+
+class ChatSessionState:
+    """One conversation held in memory"""
+
+    __slots__ = ("id", "messages", "updated_at", "size")
+
+    def __init__(self, id: str, messages: list, updated_at: float):
+        self.id = id
+        self.messages = messages
+        self.updated_at = updated_at
+        self.size = sum(_message_size(m) for m in messages)
+
+
+def _message_size(message: dict) -> int:
+    return len(message.get("content", "").encode("utf-8")) + 16
+
+
+class SessionStore:
+    """
+    Bounded session store: an in-memory LRU that spills to SQLite.
+
+    - At most `max_sessions` conversations / `max_bytes` of message text stay
+      in memory; the least recently used are written to the ChatSession
+      table and loaded back on their next request.
+    - Sessions idle for more than `ttl_seconds` expire in both tiers; expired
+      rows are deleted by purge_expired() (see purge_periodically()).
+    - A conversation keeps its last `max_messages` messages.
+
+    The *_async methods are for the event loop: SQLite work runs on a single
+    dedicated thread, so it is serialized and never blocks request handling.
+    Sessions being spilled stay reachable until their row is written.
+    """
+
+    def __init__(self, db_engine, max_sessions: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 86400, max_messages: int = 100, purge_interval: float = 600):
+        self.db_engine = db_engine
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.purge_interval = purge_interval
+        self._sessions = OrderedDict()  # id -> ChatSessionState, least recently used first
+        self._spilling = {}             # id -> ChatSessionState whose row is being written
+        self._locks = weakref.WeakValueDictionary()  # id -> asyncio.Lock, alive while in use
+        self._bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+        self.spilled = 0
+        self.loaded = 0
+
+    # ---------- public API ----------
+
+    def create(self, messages: list = None) -> ChatSessionState:
+        state = self._new(messages)
+        self._spill(self._insert(state))
+        return state
+
+    async def create_async(self, messages: list = None) -> ChatSessionState:
+        state = self._new(messages)
+        await self._spill_async(self._insert(state))
+        return state
+
+    def get(self, session_id: str):
+        """Session by ID from memory or SQLite; None when unknown or expired"""
+        state, known = self._cached(session_id)
+        if known:
+            return state
+        state, evicted = self._adopt(self._load(session_id))
+        self._spill(evicted)
+        return state
+
+    async def get_async(self, session_id: str):
+        state, known = self._cached(session_id)
+        if known:
+            return state
+        row_state = await self._run(self._load, session_id)
+        state, evicted = self._adopt(row_state)
+        await self._spill_async(evicted)
+        return state
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """
+        One turn at a time per conversation. Keyed by ID rather than held by the
+        state, because a spilled and reloaded session is a new state object.
+        """
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def append(self, session_id: str, messages: list):
+        """Add messages to a session (reloading it if it was spilled meanwhile)"""
+        state = self.get(session_id)
+        if state is None:
+            return None
+        self._spill(self._extend(state, messages))
+        return state
+
+    async def append_async(self, session_id: str, messages: list):
+        state = await self.get_async(session_id)
+        if state is None:
+            return None
+        await self._spill_async(self._extend(state, messages))
+        return state
+
+    def delete(self, session_id: str):
+        self._forget(session_id)
+        self._delete_row(session_id)
+
+    async def delete_async(self, session_id: str):
+        self._forget(session_id)
+        await self._run(self._delete_row, session_id)
+
+    def purge_expired(self):
+        cutoff = self._purge_memory()
+        self._purge_rows(cutoff)
+
+    async def purge_periodically(self):
+        """Background task: drop expired sessions every `purge_interval` seconds"""
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self._run(self._purge_rows, self._purge_memory())
+            except Exception as e:
+                print(f"⚠️ Session purge failed: {e}")
+
+    def flush(self):
+        """Spill every in-memory session (shutdown), so they survive a restart"""
+        self._spill(list(self._sessions.values()))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "in_memory": len(self._sessions),
+            "bytes": self._bytes,
+            "spilled": self.spilled,
+            "loaded": self.loaded,
+        }
+
+    # ---------- internals ----------
+
+    def _new(self, messages: list) -> ChatSessionState:
+        return ChatSessionState(uuid.uuid4().hex, list(messages or [])[-self.max_messages:], time.time())
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _expired(self, state: ChatSessionState) -> bool:
+        return time.time() - state.updated_at > self.ttl_seconds
+
+    def _cached(self, session_id: str):
+        """
+        Returns:
+            (state, known): known is False when only SQLite can answer
+        """
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._spilling.get(session_id)
+            if state is None:
+                return None, False
+            # Back in use before its row was written: memory stays authoritative
+            self._sessions[state.id] = state
+            self._bytes += state.size
+        if self._expired(state):
+            # The row, if any, is older still and goes with the next purge
+            self._forget(session_id)
+            return None, True
+        self._sessions.move_to_end(session_id)
+        return state, True
+
+    def _adopt(self, state):
+        """Insert a state loaded from SQLite, unless the session got back in memory meanwhile"""
+        if state is None:
+            return None, []
+        current = self._sessions.get(state.id) or self._spilling.get(state.id)
+        if current is not None:
+            return self._cached(state.id)[0], []
+        self.loaded += 1
+        return state, self._insert(state)
+
+    def _insert(self, state: ChatSessionState) -> list:
+        self._sessions[state.id] = state
+        self._bytes += state.size
+        return self._evict()
+
+    def _extend(self, state: ChatSessionState, messages: list) -> list:
+        self._bytes -= state.size
+        state.messages = (state.messages + messages)[-self.max_messages:]
+        state.size = sum(_message_size(m) for m in state.messages)
+        state.updated_at = time.time()
+        self._bytes += state.size
+        return self._evict()
+
+    def _forget(self, session_id: str):
+        state = self._sessions.pop(session_id, None)
+        if state is not None:
+            self._bytes -= state.size
+        self._spilling.pop(session_id, None)
+
+    def _evict(self) -> list:
+        """Least recently used sessions over the caps (to be spilled by the caller)"""
+        evicted = []
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            _, state = self._sessions.popitem(last=False)
+            self._bytes -= state.size
+            evicted.append(state)
+        return evicted
+
+    def _purge_memory(self) -> float:
+        cutoff = time.time() - self.ttl_seconds
+        for state in [s for s in self._sessions.values() if s.updated_at < cutoff]:
+            self._forget(state.id)
+        return cutoff
+
+    def _purge_rows(self, cutoff: float):
+        with Session(self.db_engine) as db:
+            db.exec(delete(ChatSession).where(ChatSession.updated_at < cutoff))
+            db.commit()
+
+    def _delete_row(self, session_id: str):
+        with Session(self.db_engine) as db:
+            db.exec(delete(ChatSession).where(ChatSession.id == session_id))
+            db.commit()
+
+    def _spill(self, states: list):
+        if not states:
+            return
+        with Session(self.db_engine) as db:
+            for state in states:
+                db.merge(ChatSession(
+                    id=state.id,
+                    messages=json.dumps(state.messages, ensure_ascii=False),
+                    updated_at=state.updated_at,
+                ))
+            db.commit()
+        self.spilled += len(states)
+
+    async def _spill_async(self, states: list):
+        if not states:
+            return
+        for state in states:
+            self._spilling[state.id] = state
+        try:
+            await self._run(self._spill, states)
+        finally:
+            for state in states:
+                if self._spilling.get(state.id) is state:
+                    del self._spilling[state.id]
+
+    def _load(self, session_id: str):
+        """State from its SQLite row; None when missing or expired (runs off the loop)"""
+        with Session(self.db_engine) as db:
+            row = db.exec(select(ChatSession).where(ChatSession.id == session_id)).first()
+        if row is None or time.time() - row.updated_at > self.ttl_seconds:
+            return None
+        return ChatSessionState(row.id, json.loads(row.messages), row.updated_at)
+
+
+def create_session_store(db_engine) -> SessionStore:
+    """
+    Env:
+        SESSION_MAX_ACTIVE: conversations kept in memory (default 1000)
+        SESSION_MAX_MEMORY_MB: message text kept in memory (default 64)
+        SESSION_TTL: seconds a session survives without activity (default 86400)
+        SESSION_MAX_MESSAGES: messages kept per conversation (default 100)
+        SESSION_PURGE_INTERVAL: seconds between expired-session purges (default 600)
+    """
+    return SessionStore(
+        db_engine,
+        max_sessions=int(os.getenv("SESSION_MAX_ACTIVE", "1000")),
+        max_bytes=int(os.getenv("SESSION_MAX_MEMORY_MB", "64")) * 1024 * 1024,
+        ttl_seconds=float(os.getenv("SESSION_TTL", "86400")),
+        max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "100")),
+        purge_interval=float(os.getenv("SESSION_PURGE_INTERVAL", "600")),
+    )
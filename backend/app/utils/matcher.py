@@ -0,0 +1,173 @@
+"""
+Compiled multi-keyword matching
+One Aho-Corasick automaton finds every keyword of a table in a single pass over the text
+"""
+import re
+import unicodedata
+from collections import deque
+
+# Zero-width characters, soft hyphen and word joiner are invisible and split keywords
+_INVISIBLE = re.compile("[\u00ad\u180e\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff]")
+# Latin combining accents only: Thai vowels and tone marks are combining marks too
+_LATIN_ACCENTS = re.compile("[\u0300-\u036f]")
+# Thai nikhahit typed before the tone mark instead of after it ("น ํ ้ า" vs "น ้ ํ า")
+_THAI_NIKHAHIT_TONE = re.compile("\u0e4d([\u0e48-\u0e4b])")
+_WHITESPACE = re.compile(r"\s+")
+
+# Cyrillic / Greek look-alikes of Latin letters (after casefold)
+_CONFUSABLES = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+    "ԁ": "d", "ԛ": "q", "ԝ": "w", "һ": "h", "ӏ": "l",
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o",
+    "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+})
+
+
+def fold_text(text: str) -> str:
+    """
+    Canonical form for keyword matching; keywords and input go through the same folding.
+
+    NFKD (full-width letters, ligatures, Thai sara am) with Latin accents
+    dropped, casefold, Cyrillic/Greek homoglyphs mapped to Latin, invisible
+    characters removed, Thai mark order fixed and whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = _LATIN_ACCENTS.sub("", text)
+    text = text.casefold().translate(_CONFUSABLES)
+    text = _INVISIBLE.sub("", text)
+    text = _THAI_NIKHAHIT_TONE.sub("\\1\u0e4d", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _is_latin_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def _whole_word(text: str, start: int, end: int, keyword: str, suffixes=()) -> bool:
+    """
+    False when a Latin keyword edge continues a Latin word in the text,
+    unless the word only continues with one of `suffixes` ("hack" + "ing")
+    """
+    if start > 0 and _is_latin_word_char(keyword[0]) and _is_latin_word_char(text[start - 1]):
+        return False
+    if end < len(text) and _is_latin_word_char(keyword[-1]) and _is_latin_word_char(text[end]):
+        return any(
+            text.startswith(suffix, end)
+            and not (end + len(suffix) < len(text) and _is_latin_word_char(text[end + len(suffix)]))
+            for suffix in suffixes
+        )
+    return True
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a keyword table.
+
+    Matching walks the folded text once, so the cost depends on the text
+    length and the number of matches, not on how many keywords there are.
+    Keywords are plain substrings (Thai has no word boundaries); each one
+    carries the labels it was added with. With word_boundaries=True, a
+    keyword that starts or ends with a Latin letter or digit must not touch
+    another one there ("hack" no longer matches "hackathon"); Thai keywords
+    stay substrings. `suffixes` lists word endings still accepted after a
+    keyword, e.g. ("ing", "ed") so "hack" also matches "hacking".
+
+    Usage:
+        matcher = KeywordMatcher({"vpn": ["IT"], "เงินเดือน": ["HR"]})
+        matcher.labels("VPN ใช้ไม่ได้")  # {"IT": 1}
+    """
+
+    def __init__(self, keywords=None, normalize=fold_text, word_boundaries: bool = False, suffixes=()):
+        self.normalize = normalize
+        self.word_boundaries = word_boundaries
+        self.suffixes = tuple(suffixes)
+        self._goto = [{}]   # state -> {char: next state}
+        self._fail = [0]
+        self._own = [()]    # state -> ((keyword, labels),) when a keyword ends here
+        self._out = [()]    # compiled: own output plus those of the failure chain
+        self._compiled = True
+        self.size = 0
+        for keyword, labels in (keywords.items() if isinstance(keywords, dict) else keywords or ()):
+            self.add(keyword, labels)
+
+    def add(self, keyword: str, labels=()):
+        """Add a keyword (labels: a label or an iterable of labels)"""
+        keyword = self.normalize(keyword)
+        if not keyword:
+            return
+        labels = (labels,) if isinstance(labels, str) else tuple(labels)
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append(())
+                self._out.append(())
+            state = nxt
+        if self._own[state]:
+            labels = tuple(dict.fromkeys(self._own[state][0][1] + labels))
+        else:
+            self.size += 1
+        self._own[state] = ((keyword, labels),)
+        self._compiled = False
+
+    def _compile(self):
+        """Failure links, breadth first; outputs inherit their failure state's"""
+        self._out = list(self._own)
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                queue.append(nxt)
+            self._out[state] = self._own[state] + self._out[self._fail[state]]
+        self._compiled = True
+
+    def _scan(self, text: str):
+        if not self._compiled:
+            self._compile()
+        goto, fail, out = self._goto, self._fail, self._out
+        bounded, suffixes = self.word_boundaries, self.suffixes
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword, labels in out[state]:
+                start = end - len(keyword)
+                if bounded and not _whole_word(text, start, end, keyword, suffixes):
+                    continue
+                yield start, end, keyword, labels
+
+    def find_all(self, text: str, normalized: bool = False) -> list:
+        """
+        Returns:
+            [(start, end, keyword, labels)] with offsets into the folded text,
+            in order of their end position
+        """
+        return list(self._scan(text if normalized else self.normalize(text)))
+
+    def first(self, text: str, normalized: bool = False):
+        """First match or None; stops scanning as soon as one is found"""
+        return next(self._scan(text if normalized else self.normalize(text)), None)
+
+    def labels(self, text: str, normalized: bool = False) -> dict:
+        """{label: number of keyword hits} for the text"""
+        counts = {}
+        for _, _, _, labels in self._scan(text if normalized else self.normalize(text)):
+            for label in labels:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    def __len__(self):
+        return self.size
@@ -1,109 +1,492 @@
 import os
+import time
 import asyncio
-from qdrant_client import QdrantClient
-from groq import Groq
+import hashlib
+import numpy as np
 from fastembed import TextEmbedding
-import re
+from .llm import create_groq_client, parse_structured_answer, STRUCTURED_ANSWER_INSTRUCTIONS
+from .semantic_cache import SemanticCache
+from .embedding import QueryEmbedder
+from .cache import LRUCache
+from .text import normalize_query
+from .vector_store import create_vector_store
+from .context import ContextPacker
+from .summary import ConversationSummarizer, prefix_hashes
+from .singleflight import SingleFlight
+from .guard import create_guard
+from ..wut_orchestrator import WUTClassifier, EmbeddingClassifier, DecisionEngine, default_centroids_path
+from .lexical import (
+    BM25Index, TokenizerMismatchError, default_index_path, is_exact_term_query, reciprocal_rank_fusion,
+)
+
+_UNSET = object()
 
 class WAYRAGEngine:
     def __init__(self):
-        # 1. Setup Qdrant (Database)
-        qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
-        qdrant_key = os.getenv("QDRANT_API_KEY", None)
-        self.qdrant = QdrantClient(url=qdrant_url, api_key=qdrant_key)
+        # 0. Layer 0 guard: configured patterns compiled once into one matcher
+        self.guard = create_guard()
+
+        # 1. Setup Vector Store (remote Qdrant, local Qdrant or in-process NumPy index)
         self.collection_name = "mango_kb"
+        self.vector_store = create_vector_store(self.collection_name)
+        
+        # Semaphore to limit concurrent vector searches (prevent connection exhaustion)
+        self.qdrant_semaphore = asyncio.Semaphore(int(os.getenv("VECTOR_SEARCH_CONCURRENCY", "5")))
+        self.search_timeout = float(os.getenv("VECTOR_SEARCH_TIMEOUT", "3"))
+
+        # BM25 index written by the ingestion script, fused with vector hits (RRF)
+        self.lexical_index = None
+        self.search_limit = int(os.getenv("CONTEXT_CANDIDATES", "6"))  # handed to the context packer
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "10"))
+        self.lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", str(default_index_path(self.collection_name)))
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        if self.hybrid_search:
+            self.lexical_index = self._load_lexical_index()
+            if self.lexical_index is not None:
+                print(f"🔤 Lexical index: {len(self.lexical_index)} chunks")
+
+        # Retrieval cache: (query, collection, limit, filters) -> (query vector, hits)
+        # Cleared whenever ingestion publishes a new index version
+        self.retrieval_cache = None
+        retrieval_cache_size = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+        if retrieval_cache_size > 0:
+            self.retrieval_cache = LRUCache(
+                retrieval_cache_size, ttl_seconds=float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+            )
+        # Department-scoped search: a department the query names unambiguously (curated,
+        # word-bounded keywords) becomes a payload filter, with an unfiltered retry
+        # when the scoped search finds too little
+        self.keyword_classifier = WUTClassifier()
+        self.department_filter = os.getenv("DEPARTMENT_FILTER", "true").lower() == "true"
+        self.department_min_results = int(os.getenv("DEPARTMENT_FILTER_MIN_RESULTS", "2"))
+
+        # Routing: department probabilities from the query vector (centroids written by
+        # ingestion) and retrieval support give DecisionEngine its confidence
+        self.centroids_path = os.getenv(
+            "DEPARTMENT_CENTROIDS_PATH", str(default_centroids_path(self.collection_name))
+        )
+        self.embedding_classifier = EmbeddingClassifier.load(self.centroids_path)
+        self.decision_engine = DecisionEngine()
+        self.decisions = {}
+        # FAQ direct answers: FAQ questions indexed on their own (answer in the payload);
+        # a fresh question this close to one gets the curated answer without the LLM
+        self.faq_store = None
+        if os.getenv("FAQ_DIRECT_ANSWER", "true").lower() == "true":
+            self.faq_store = create_vector_store(os.getenv("FAQ_COLLECTION", "mango_faq"))
+        self.faq_threshold = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.92"))
+        self._faq_available = True
+        self.faq_hits = 0
+        self.faq_misses = 0
+        self.index_version_interval = float(os.getenv("INDEX_VERSION_CHECK_INTERVAL", "30"))
+        self.index_version = _UNSET
+        self._index_version_checked = 0.0
         
-        # Semaphore to limit concurrent Qdrant operations (prevent connection exhaustion)
-        self.qdrant_semaphore = asyncio.Semaphore(5)  # Max 5 concurrent queries
+        # Prompt token budget shared by chat history and retrieved chunks
+        self.context_packer = ContextPacker(
+            budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+            history_share=float(os.getenv("CONTEXT_HISTORY_SHARE", "0.35")),
+            mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+            duplicate_threshold=float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.92")),
+        )
         
         # 2. Setup Local Embedding (Free Brain for Search)
         print("🧠 Loading Local Embedding Model...")
         self.embed_model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
+        self.query_embedder = QueryEmbedder(
+            self.embed_model,
+            max_workers=int(os.getenv("EMBED_WORKERS", "1")),
+            cache_size=int(os.getenv("EMBED_CACHE_SIZE", "2048")),
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "16")),
+            batch_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")),
+        )
 
-    async def generate_answer(self, messages: list):
+        # 3. Shared async Groq client (created in the app lifespan, see create_groq_client)
+        self.groq = None
+        self.answer_timeout = float(os.getenv("GROQ_TIMEOUT", "30"))
+        # "combined": one call returns the answer and its follow-up questions (JSON);
+        # "two-call": separate answer and suggestion calls
+        self.answer_mode = os.getenv("ANSWER_MODE", "two-call")
+        self.suggest_timeout = float(os.getenv("GROQ_SUGGEST_TIMEOUT", "10"))
+
+        # Rolling summaries of older turns in long conversations
+        self.conversation_summarizer = None
+        if os.getenv("CONVERSATION_SUMMARY_ENABLED", "true").lower() == "true":
+            self.conversation_summarizer = ConversationSummarizer(
+                self._summarize_turns,
+                trigger_messages=int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "8")),
+                keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", "4")),
+                cache_size=int(os.getenv("SUMMARY_CACHE_SIZE", "1024")),
+                ttl_seconds=float(os.getenv("SUMMARY_CACHE_TTL", "86400")),
+            )
+
+        # Follow-up suggestions started as soon as an answer exists, keyed by answer hash
+        self.speculative_suggestions = os.getenv("SPECULATIVE_SUGGESTIONS", "true").lower() == "true"
+        self.suggestion_cache = LRUCache(
+            int(os.getenv("SUGGEST_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("SUGGEST_CACHE_TTL", "600")),
+        )
+        self._background_tasks = set()
+
+        # Identical concurrent requests (e.g. an outage question) share one computation
+        self.answer_flights = SingleFlight()
+        self.retrieval_flights = SingleFlight()
+
+        # 4. Semantic answer cache (skips the LLM for paraphrased questions)
+        self.semantic_cache = None
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true":
+            self.semantic_cache = SemanticCache(
+                threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+                ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+                max_bytes=int(os.getenv("SEMANTIC_CACHE_MAX_MB", "16")) * 1024 * 1024,
+            )
+
+    def _get_groq(self):
+        """Return the shared Groq client, creating it lazily outside the lifespan hook"""
+        if self.groq is None:
+            self.groq = create_groq_client()
+        return self.groq
+
+    def metrics(self) -> dict:
+        """Runtime counters for the engine's caches"""
+        return {
+            "guard": self.guard.stats(),
+            "query_embedding": self.query_embedder.stats(),
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache else None,
+            "retrieval_cache": self.retrieval_cache.stats() if self.retrieval_cache else None,
+            "index_version": None if self.index_version is _UNSET else self.index_version,
+            "conversation_summary": self.conversation_summarizer.stats() if self.conversation_summarizer else None,
+            "suggestions": self.suggestion_cache.stats(),
+            "faq": {"hits": self.faq_hits, "misses": self.faq_misses} if self.faq_store else None,
+            "decisions": dict(self.decisions),
+            "coalescing": {
+                "answers": self.answer_flights.stats(),
+                "retrieval": self.retrieval_flights.stats(),
+            },
+        }
+
+    async def aclose(self):
+        """Release pooled connections and worker threads held by the engine"""
+        self.query_embedder.shutdown()
+        if self.conversation_summarizer is not None:
+            self.conversation_summarizer.cancel()
+        for task in list(self._background_tasks):
+            task.cancel()
+        await self.vector_store.aclose()
+        if self.faq_store is not None:
+            await self.faq_store.aclose()
+        if self.groq is not None:
+            await self.groq.close()
+            self.groq = None
+
+    async def _prepare(self, messages: list) -> dict:
         """
-        Generate answer with conversation context.
-        
-        Args:
-            messages: List of message dicts [{"role": "user"|"assistant", "content": "..."}]
+        Run the steps shared by every answer path: guard, FAQ match, history
+        formatting and retrieval.
+
+        Returns:
+            {"reply": "...", "path": "invalid"|"guard"|"faq"|"error"} when the
+            request is answered without the LLM, or
+            {"query", "query_vector", "has_history", "chat_history", "context", "hits"}
+            ready for prompting, with history and hits packed into the token
+            budget. query_vector is None when retrieval failed.
         """
         # Guard clause for empty messages
         if not messages:
-            return "Please provide a message to get started."
+            return {"reply": "Please provide a message to get started.", "path": "invalid"}
         
         # Extract last user message for vector search
         user_messages = [m for m in messages if m.get("role") == "user"]
         if not user_messages:
-            return "Please provide a user message."
+            return {"reply": "Please provide a user message.", "path": "invalid"}
         
         query = user_messages[-1]["content"] if user_messages else ""
+
+        # Layer 0: Hard Rules (The "Reflex" Layer)
+        # Every user message is scanned before any formatting, embedding or retrieval
+        if await self.guard.check_async(messages) is not None:
+            return {"reply": self.guard.reply, "path": "guard"}
         
-        # Format chat history for context (exclude last message, it's the current query)
+        # Chat history for context (exclude last message, it's the current query);
+        # long conversations send a rolling summary plus the turns after it
+        history = messages[:-1]
+        summary = None
+        if self.conversation_summarizer is not None:
+            summary, history = self.conversation_summarizer.condense(history)
+        # Greeting-only history (assistant messages) does not change the answer
+        has_history = len(user_messages) > 1
+
+        # Step 1: A fresh question matching a curated FAQ gets its answer as is
+        # (codes such as "MAT-001" go straight to the lexical index instead)
+        if self.faq_store is not None and not has_history and not is_exact_term_query(query):
+            faq = await self._faq_match(query)
+            if faq is not None:
+                return {"reply": faq["answer"], "path": "faq"}
+
+        # Step 2: Search relevant info from knowledge base
+        # (one keyword pass gives both the retrieval scope and the routing intent)
+        classification = self.keyword_classifier.classify_scoped(query)
+        search_result = []
+        query_vector = None
+        search_error = None
+        try:
+            retrieved = await self._scoped_retrieve(query, classification["scope"])
+            if retrieved is None:
+                return {"reply": "I'm experiencing high load. Please try again in a moment.", "path": "error"}
+            query_vector, search_result = retrieved
+        except Exception as e:
+            print(f"Search Error: {e}")
+            search_error = "Error retrieving context."
+            query_vector = None
+        decision = self._decide(classification, query_vector, search_result)
+
+        # Step 3: Fit history and chunks into the prompt token budget
+        packed = self.context_packer.pack(history, search_result, summary=summary)
         chat_history_lines = []
-        for msg in messages[:-1]:  # Exclude last message
+        if packed["summary"]:
+            chat_history_lines.append(f"Summary of earlier conversation: {packed['summary']}")
+        for msg in packed["history"]:
             role_label = "User" if msg.get("role") == "user" else "AI"
             chat_history_lines.append(f"{role_label}: {msg.get('content', '')}")
         chat_history = "\n".join(chat_history_lines) if chat_history_lines else "No previous conversation."
 
-        # Layer 0: Hard Rules (The "Reflex" Layer)
-        # Block specific keywords or commands immediately
-        blocked_patterns = [
-            r"ignore previous instructions",
-            r"system prompt",
-            r"hack",
-            r"bypass"
-        ]
-        for pattern in blocked_patterns:
-            if re.search(pattern, query, re.IGNORECASE):
-                return "I cannot fulfill this request due to safety guidelines."
+        if search_error:
+            context = search_error
+        elif packed["texts"]:
+            # Ingest-time digests when available, see ContextPacker
+            context = "\n".join(f"- {text}" for text in packed["texts"])
+        else:
+            context = "No relevant documents found."
+        search_result = packed["hits"]
+
+        return {
+            "path": "llm",
+            "query": query,
+            "query_vector": query_vector,
+            "has_history": has_history,
+            "chat_history": chat_history,
+            "context": context,
+            "hits": search_result,
+            "decision": decision,
+        }
+
+    def _decide(self, classification: dict, query_vector, hits: list):
+        """
+        Route the request through DecisionEngine.
 
-        # Step 1: Search relevant info from knowledge base
+        confidence = min(probability of the embedding classifier's department,
+        best cosine between the query and a retrieved chunk): high only when
+        the department is clear and the knowledge base covers the question.
+        The intent comes from the keyword pass that also scoped retrieval.
+
+        Returns:
+            {"action", "department", "intent", "confidence", "retrieval_score"},
+            or None without a query vector or department centroids
+        """
+        if query_vector is None or self.embedding_classifier is None:
+            return None
+        routed = self.embedding_classifier.classify(query_vector)
+        vectors = [hit.vector for hit in hits if getattr(hit, "vector", None) is not None]
+        retrieval_score = 0.0
+        if vectors:
+            q = np.asarray(query_vector, dtype=np.float32)
+            m = np.asarray(vectors, dtype=np.float32)
+            denom = np.linalg.norm(m, axis=1) * (np.linalg.norm(q) or 1.0)
+            retrieval_score = max(0.0, float(np.max((m @ q) / np.where(denom == 0, 1, denom))))
+        confidence = min(routed["confidence"], retrieval_score)
+        intent = classification["intent"]
+        action = self.decision_engine.decide(confidence, routed["department"], intent)
+        self.decisions[action] = self.decisions.get(action, 0) + 1
+        return {
+            "action": action,
+            "department": routed["department"],
+            "intent": intent,
+            "confidence": round(confidence, 4),
+            "retrieval_score": round(retrieval_score, 4),
+        }
+
+    async def _faq_match(self, query: str):
+        """Payload {"question", "answer", ...} of the closest FAQ question at or above faq_threshold, else None"""
+        await self._check_index_version()
+        if not self._faq_available:
+            return None
         try:
-            query_vector = list(self.embed_model.embed([query]))[0]
-            
-            # Use semaphore to limit concurrent Qdrant connections + timeout protection
+            query_vector = await self.query_embedder.embed(query)
             async with self.qdrant_semaphore:
-                try:
-                    # Run blocking Qdrant call in thread pool with timeout
-                    search_result = await asyncio.wait_for(
-                        asyncio.to_thread(
-                            self.qdrant.query_points,
-                            collection_name=self.collection_name,
-                            query=query_vector,
-                            limit=3
-                        ),
-                        timeout=3.0  # 3 second timeout
-                    )
-                    search_result = search_result.points
-                except asyncio.TimeoutError:
-                    print("⏱️ Qdrant query timeout (3s)")
-                    return "I'm experiencing high load. Please try again in a moment."
-            
-            if search_result:
-                context = "\n".join([f"- {hit.payload['content'][:800]}..." for hit in search_result])
+                hits = await asyncio.wait_for(
+                    self.faq_store.search(query_vector, limit=1), timeout=self.search_timeout
+                )
+        except asyncio.TimeoutError:
+            return None
+        except Exception as e:
+            # Typically no FAQ index yet; retried after the next index version change
+            print(f"FAQ Search Error (disabled until the index changes): {e}")
+            self._faq_available = False
+            return None
+        if hits and hits[0].score >= self.faq_threshold and hits[0].payload.get("answer"):
+            self.faq_hits += 1
+            return hits[0].payload
+        self.faq_misses += 1
+        return None
+
+    async def _scoped_retrieve(self, query: str, department: str = None):
+        """
+        _retrieve() within the query's department, falling back to the whole
+        collection. Only a confident keyword scope (classify_scoped) filters;
+        anything less searches everything rather than an arbitrary slice of the KB.
+        """
+        if not self.department_filter or department is None:
+            return await self._retrieve(query)
+        retrieved = await self._retrieve(query, {"department": department})
+        if retrieved is not None and len(retrieved[1]) < self.department_min_results:
+            return await self._retrieve(query)
+        return retrieved
+
+    async def _retrieve(self, query: str, filters: dict = None):
+        """
+        BM25 + vector retrieval fused with RRF, behind the retrieval cache.
+
+        Returns:
+            (query_vector, hits), or None when the vector search timed out and
+            there is nothing to fall back to. query_vector is None for
+            exact-term queries answered from the lexical index alone.
+        """
+        await self._check_index_version()
+        key = (
+            normalize_query(query), self.collection_name, self.search_limit,
+            tuple(sorted(filters.items())) if filters else None,
+        )
+        if self.retrieval_cache is not None:
+            cached = self.retrieval_cache.get(key)
+            if cached is not None:
+                return cached
+        return await self.retrieval_flights.do(key, lambda: self._retrieve_uncached(query, key, filters))
+
+    async def _retrieve_uncached(self, query: str, key: tuple, filters: dict = None):
+        search_result = []
+        query_vector = None
+        if self.lexical_index and is_exact_term_query(query):
+            # Codes such as "BD" or "MAT-001" match exactly; no embedding needed
+            search_result = self.lexical_index.search(query, limit=self.search_limit, filters=filters)
+
+        if not search_result:
+            lexical_task = asyncio.create_task(self._lexical_search(query, filters))
+            try:
+                query_vector, vector_hits = await self._vector_search(query, filters)
+            except asyncio.TimeoutError:
+                print(f"⏱️ Vector search timeout ({self.search_timeout:g}s)")
+                vector_hits = None
+            lexical_hits = await lexical_task
+
+            if vector_hits is None:
+                if not lexical_hits:
+                    return None
+                # Not cached: the next request should retry the vector search
+                return None, lexical_hits[:self.search_limit]
+            if lexical_hits:
+                search_result = reciprocal_rank_fusion([vector_hits, lexical_hits], limit=self.search_limit)
             else:
-                context = "No relevant documents found."
+                search_result = vector_hits[:self.search_limit]
+
+        if self.retrieval_cache is not None:
+            # Hits as retrieved (chunks are already bounded by CHUNK_MAX_TOKENS at
+            # ingestion), so a cache hit packs exactly the same context as a miss
+            self.retrieval_cache.put(key, (query_vector, search_result))
+        return query_vector, search_result
+
+    async def _check_index_version(self):
+        """
+        Poll the store's index-version marker (at most every
+        INDEX_VERSION_CHECK_INTERVAL seconds) and drop everything derived from
+        the previous index when ingestion has published a new one.
+        """
+        now = time.monotonic()
+        if now - self._index_version_checked < self.index_version_interval:
+            return
+        self._index_version_checked = now
+        try:
+            version = await self.vector_store.index_version()
         except Exception as e:
-            print(f"Search Error: {e}")
-            context = "Error retrieving context."
+            print(f"Index version check failed: {e}")
+            return
+        if self.index_version is _UNSET:
+            self.index_version = version
+            return
+        if version == self.index_version:
+            return
 
-        # Step 2: Generate Answer using Groq (Free & Fast)
-        groq_key = os.getenv("GROQ_API_KEY")
-        if not groq_key:
-            return "⚠️ Error: GROQ_API_KEY not found in Render Environment Variables."
+        print(f"🔄 Index version changed ({self.index_version} -> {version}), clearing retrieval caches")
+        self.index_version = version
+        self.vector_store.reload()
+        if self.faq_store is not None:
+            self.faq_store.reload()
+            self._faq_available = True
+        if self.hybrid_search:
+            self.lexical_index = await asyncio.to_thread(self._load_lexical_index)
+        self.embedding_classifier = await asyncio.to_thread(EmbeddingClassifier.load, self.centroids_path)
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
 
+    def _load_lexical_index(self):
+        """BM25 index for hybrid search, or None (vector-only) when it was tokenized differently"""
         try:
-            client = Groq(api_key=groq_key)
-            
-            # Enhanced Prompt Engineering with Chat History
-            system_prompt = f"""You are a helpful AI assistant for Mango Consultant.
+            return BM25Index.load(self.lexical_index_path)
+        except TokenizerMismatchError as e:
+            print(f"⚠️ Hybrid search disabled until the lexical index is rebuilt: {e}")
+            return None
+
+    async def _vector_search(self, query: str, filters: dict = None):
+        """Embed the query and search the vector store; raises asyncio.TimeoutError past search_timeout"""
+        query_vector = await self.query_embedder.embed(query)
+        # Pull extra candidates when they will be fused with lexical hits
+        limit = self.hybrid_candidates if self.lexical_index else self.search_limit
+
+        # Use semaphore to limit concurrent searches + timeout protection
+        async with self.qdrant_semaphore:
+            hits = await asyncio.wait_for(
+                self.vector_store.search(query_vector, limit=limit, with_vectors=True, filters=filters),
+                timeout=self.search_timeout,
+            )
+        return query_vector, hits
+
+    async def _lexical_search(self, query: str, filters: dict = None) -> list:
+        """BM25 candidates, scored off the event loop while the vector search runs"""
+        if not self.lexical_index:
+            return []
+        return await asyncio.to_thread(self.lexical_index.search, query, self.hybrid_candidates, filters)
+
+    def _cacheable(self, prepared: dict) -> bool:
+        """Semantic cache applies to fresh conversations with successful retrieval"""
+        return (
+            self.semantic_cache is not None
+            and not prepared["has_history"]
+            and prepared["query_vector"] is not None
+        )
+
+    def _cache_lookup(self, prepared: dict):
+        if not self._cacheable(prepared):
+            return None
+        doc_ids = [hit.id for hit in prepared["hits"]]
+        return self.semantic_cache.lookup(prepared["query_vector"], doc_ids)
+
+    def _cache_store(self, prepared: dict, answer: str):
+        if self._cacheable(prepared) and answer:
+            doc_ids = [hit.id for hit in prepared["hits"]]
+            self.semantic_cache.store(prepared["query_vector"], doc_ids, answer)
+
+    def _build_llm_messages(self, prepared: dict, structured: bool = False) -> list:
+        """Build the Groq chat messages from the output of `_prepare`"""
+        # Enhanced Prompt Engineering with Chat History
+        system_prompt = f"""You are a helpful AI assistant for Mango Consultant.
 Use the Chat History and Retrieved Context to provide accurate, contextual answers.
 
 === CHAT HISTORY ===
-{chat_history}
+{prepared["chat_history"]}
 
 === RETRIEVED CONTEXT ===
-{context}
+{prepared["context"]}
 
 === INSTRUCTIONS ===
 1. Use chat history to maintain conversation continuity
@@ -111,33 +494,256 @@ Use the Chat History and Retrieved Context to provide accurate, contextual answe
 3. Prioritize retrieved context for factual answers
 4. If you don't know something, say so honestly
 5. Respond in the same language as the user's query"""
+        if structured:
+            system_prompt += f"\n\n=== OUTPUT FORMAT ===\n{STRUCTURED_ANSWER_INSTRUCTIONS}"
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prepared["query"]}
+        ]
+
+    async def generate_answer(self, messages: list):
+        """
+        Generate answer with conversation context.
+        
+        Args:
+            messages: List of message dicts [{"role": "user"|"assistant", "content": "..."}]
+        """
+        return (await self.answer(messages))["response"]
+
+    async def answer(self, messages: list) -> dict:
+        """
+        `generate_answer` plus the path that produced the response.
+
+        Concurrent calls for the same question and history share one run.
+
+        Returns:
+            {"response": "...", "path": "llm"|"cache"|"faq"|"guard"|"invalid"|"error",
+             "decision": routing from `_decide`, or None}
+        """
+        return await self.answer_flights.do(self._flight_key(messages), lambda: self._answer(messages))
+
+    @staticmethod
+    def _flight_key(messages: list) -> tuple:
+        """(normalized last message, fingerprint of everything before it)"""
+        if not messages:
+            return ("", "")
+        history = prefix_hashes(messages[:-1])
+        return (normalize_query(messages[-1].get("content", "")), history[-1] if history else "")
+
+    async def _answer(self, messages: list) -> dict:
+        prepared = await self._prepare(messages)
+        if "reply" in prepared:
+            return {"response": prepared["reply"], "path": prepared["path"], "decision": None}
+
+        cached = self._cache_lookup(prepared)
+        if cached is not None:
+            self._speculate_suggestions(cached)
+            return {"response": cached, "path": "cache", "decision": prepared["decision"]}
+
+        # Step 2: Generate Answer using Groq (Free & Fast)
+        client = self._get_groq()
+        if client is None:
+            return {"response": "⚠️ Error: GROQ_API_KEY not found in Render Environment Variables.", "path": "error",
+                    "decision": prepared["decision"]}
+
+        if self.answer_mode == "combined":
+            answer = await self._answer_with_suggestions(client, prepared)
+            if answer is not None:
+                self._cache_store(prepared, answer)
+                return {"response": answer, "path": "llm", "decision": prepared["decision"]}
+
+        try:
+            completion = await client.chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=self._build_llm_messages(prepared),
+                temperature=0.3,
+                max_tokens=500,
+                timeout=self.answer_timeout,
+            )
+            answer = completion.choices[0].message.content
+            self._cache_store(prepared, answer)
+            self._speculate_suggestions(answer)
+            return {"response": answer, "path": "llm", "decision": prepared["decision"]}
+        except Exception as e:
+            return {"response": f"AI Error (Groq): {str(e)}", "path": "error", "decision": prepared["decision"]}
+
+    async def _answer_with_suggestions(self, client, prepared: dict):
+        """
+        One JSON-mode call for the answer and its 3 follow-up questions; the
+        questions are cached so /api/suggest needs no second call.
+
+        Returns:
+            the answer, or None when the call or its output failed (the
+            caller falls back to the two-call path)
+        """
+        try:
+            completion = await client.chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=self._build_llm_messages(prepared, structured=True),
+                temperature=0.3,
+                max_tokens=600,
+                response_format={"type": "json_object"},
+                timeout=self.answer_timeout,
+            )
+            parsed = parse_structured_answer(completion.choices[0].message.content)
+        except Exception as e:
+            print(f"Structured answer failed, using two calls: {e}")
+            return None
+        if parsed is None:
+            print("Structured answer malformed, using two calls")
+            return None
+
+        answer, suggestions = parsed
+        if suggestions:
+            self._suggestion_cache_put(answer, suggestions)
+        else:
+            self._speculate_suggestions(answer)
+        return answer
+
+    async def stream_answer(self, messages: list):
+        """
+        Streaming variant of `generate_answer`.
+
+        Yields (event, data) tuples as they become available:
+            ("context", {"sources": [...], "decision": {...}|None})
+                                             retrieved documents and routing, sent before the LLM call
+            ("token", {"content": "..."})    answer text as Groq produces it
+            ("error", {"message": "..."})    the LLM call failed mid-stream
+            ("done", {"path": "..."})        always the last event; path as in `answer`
+        """
+        prepared = await self._prepare(messages)
+        if "reply" in prepared:
+            yield "token", {"content": prepared["reply"]}
+            yield "done", {"path": prepared["path"]}
+            return
 
-            user_prompt = query
+        yield "context", {
+            "sources": [
+                {"title": hit.payload.get("title"), "section": hit.payload.get("section"), "score": hit.score}
+                for hit in prepared["hits"]
+            ],
+            "decision": prepared["decision"],
+        }
 
-            completion = client.chat.completions.create(
+        cached = self._cache_lookup(prepared)
+        if cached is not None:
+            self._speculate_suggestions(cached)
+            yield "token", {"content": cached}
+            yield "done", {"path": "cache"}
+            return
+
+        client = self._get_groq()
+        if client is None:
+            yield "token", {"content": "⚠️ Error: GROQ_API_KEY not found in Render Environment Variables."}
+            yield "done", {"path": "error"}
+            return
+
+        try:
+            stream = await client.chat.completions.create(
                 model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._build_llm_messages(prepared),
                 temperature=0.3,
                 max_tokens=500,
+                stream=True,
+                timeout=self.answer_timeout,
             )
-            return completion.choices[0].message.content
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "token", {"content": delta}
+            answer = "".join(parts)
+            self._cache_store(prepared, answer)
+            self._speculate_suggestions(answer)
         except Exception as e:
-            return f"AI Error (Groq): {str(e)}"
+            yield "error", {"message": f"AI Error (Groq): {str(e)}"}
+            yield "done", {"path": "error"}
+            return
+        yield "done", {"path": "llm"}
+
+    async def _summarize_turns(self, previous_summary, messages: list) -> str:
+        """Extend a conversation summary with the given turns (fast model, off the answer path)"""
+        client = self._get_groq()
+        if client is None:
+            return ""
+
+        turns = "\n".join(
+            f"{'User' if m.get('role') == 'user' else 'AI'}: {m.get('content', '')[:2000]}" for m in messages
+        )
+        prompt = f"""Current summary of the conversation so far:
+{previous_summary or "(none)"}
+
+New turns:
+{turns}
+
+Rewrite the summary to include the new turns in at most 120 words.
+Keep names, codes, numbers and open questions. Use the conversation's language.
+Return ONLY the summary."""
+
+        completion = await client.chat.completions.create(
+            model="llama-3.1-8b-instant",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=200,
+            timeout=self.suggest_timeout,
+        )
+        return completion.choices[0].message.content.strip()
+
+    @staticmethod
+    def _suggestion_key(answer: str) -> str:
+        return hashlib.sha256(answer.strip().encode("utf-8")).hexdigest()
+
+    def _suggestion_cache_put(self, answer: str, suggestions: list):
+        """Cache suggestions that are already known (combined answer mode)"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(suggestions)
+        self.suggestion_cache.put(self._suggestion_key(answer), future)
+
+    def _suggestion_task(self, answer: str):
+        """Cached (or newly started) background task producing suggestions for an answer"""
+        key = self._suggestion_key(answer)
+        task = self.suggestion_cache.get(key)
+        if task is None:
+            task = asyncio.create_task(self._suggest(answer))
+            self.suggestion_cache.put(key, task)
+            self._background_tasks.add(task)
+
+            def done(t):
+                self._background_tasks.discard(t)
+                # Failures come back empty: forget them so the next request retries
+                if t.cancelled() or not t.result():
+                    self.suggestion_cache.pop(key)
+            task.add_done_callback(done)
+        return task
+
+    def _speculate_suggestions(self, answer: str):
+        """Start suggestions while the client is still reading the answer"""
+        if self.speculative_suggestions and answer:
+            self._suggestion_task(answer)
+
+    async def generate_suggestions(self, last_answer: str) -> list:
+        """
+        Follow-up questions for an answer: the speculative result when one was
+        started for this answer, otherwise generated now (and cached).
+        """
+        task = self._suggestion_task(last_answer)
+        # Shielded: a client hanging up must not cancel a result other requests share
+        return list(await asyncio.shield(task))
 
-    def generate_suggestions(self, last_answer: str) -> list:
+    async def _suggest(self, last_answer: str) -> list:
         """
         Generate 3 follow-up short questions based on the answer.
         Uses Llama-3-8b for speed (Async UI pattern).
         """
-        groq_key = os.getenv("GROQ_API_KEY")
-        if not groq_key:
+        client = self._get_groq()
+        if client is None:
             return []
 
         try:
-            client = Groq(api_key=groq_key)
             prompt = f"""Given this answer: "{last_answer[:500]}"
             
             Generate 3 short, relevant follow-up questions a user might ask next.
@@ -148,11 +754,12 @@ Use the Chat History and Retrieved Context to provide accurate, contextual answe
             Who is the CEO?
             """
 
-            completion = client.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model="llama-3.1-8b-instant",  # Use fast model
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.5,
                 max_tokens=100,
+                timeout=self.suggest_timeout,
             )
             
             # Clean and parse response
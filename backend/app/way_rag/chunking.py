@@ -0,0 +1,157 @@
+"""
+Heading-aware markdown chunking
+Splits knowledge-base markdown into heading sections and FAQ Q/A pairs that fit a token budget
+"""
+import re
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_FAQ_Q = re.compile(r"^\s*\*\*Q:\*\*\s*(.*)$")
+_FAQ_A = re.compile(r"^\s*\*\*A:\*\*\s*(.*)$")
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n")
+_ASCII_WORD = re.compile(r"[A-Za-z0-9_]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a tokenizer.
+
+    Latin words count ~1.3 tokens; other characters (Thai has no word
+    spaces) count ~0.5 token each, which tracks Llama/BGE tokenizers closely
+    enough for budgeting.
+    """
+    ascii_words = _ASCII_WORD.findall(text)
+    ascii_chars = sum(len(w) for w in ascii_words)
+    other_chars = len(re.sub(r"\s", "", text)) - ascii_chars
+    return int(len(ascii_words) * 1.3 + max(other_chars, 0) * 0.5) + 1
+
+
+def split_sections(markdown: str) -> list:
+    """
+    Split markdown into sections at headings, ignoring '#' inside code fences.
+
+    Returns:
+        [{"headings": [h1, h2, ...], "lines": [...]}] in document order
+    """
+    sections = []
+    headings = []
+    lines = []
+    in_fence = False
+
+    def flush():
+        if any(line.strip() for line in lines):
+            sections.append({"headings": list(headings), "lines": list(lines)})
+        lines.clear()
+
+    for line in markdown.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            headings[:] = headings[:level - 1] + [match.group(2)]
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+
+def split_faq(lines: list) -> tuple:
+    """
+    Pull **Q:** / **A:** pairs out of a section.
+
+    Returns:
+        (pairs, rest): [{"question", "answer"}] and the non-FAQ lines
+    """
+    pairs, rest = [], []
+    current, field = None, None
+    for line in lines:
+        stripped = line.strip()
+        q = _FAQ_Q.match(line)
+        a = _FAQ_A.match(line)
+        if q:
+            current, field = {"question": q.group(1).strip(), "answer": ""}, "question"
+            pairs.append(current)
+        elif a and current is not None:
+            current["answer"], field = a.group(1).strip(), "answer"
+        elif current is not None and stripped and stripped != "---":
+            current[field] = f"{current[field]} {stripped}".strip()
+        else:
+            # A blank line after the answer (or a rule) closes the pair
+            if current is not None and (current["answer"] or stripped == "---"):
+                current = None
+            if current is None:
+                rest.append(line)
+    return [p for p in pairs if p["question"] and p["answer"]], rest
+
+
+def _split_to_budget(text: str, max_tokens: int, overlap_tokens: int, count_tokens) -> list:
+    """Greedy paragraph/sentence packing with a token-bounded overlap tail"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if count_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if not sentence.strip():
+                continue
+            # Last resort for very long unbroken runs (e.g. Thai without punctuation)
+            while count_tokens(sentence) > max_tokens:
+                cut = max(1, int(len(sentence) * max_tokens / count_tokens(sentence)))
+                units.append(sentence[:cut])
+                sentence = sentence[cut:]
+            units.append(sentence)
+
+    chunks, current = [], []
+    for unit in units:
+        if current and count_tokens("\n".join(current + [unit])) > max_tokens:
+            chunks.append("\n".join(current))
+            tail = []
+            for prev in reversed(current):
+                if count_tokens("\n".join([prev] + tail)) > overlap_tokens:
+                    break
+                tail.insert(0, prev)
+            current = tail
+        current.append(unit)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def chunk_markdown(markdown: str, max_tokens: int = 300, overlap_tokens: int = 40,
+                   count_tokens=estimate_tokens) -> list:
+    """
+    Chunk a markdown document for embedding.
+
+    Every FAQ pair becomes its own chunk; remaining section text is packed
+    into chunks of at most max_tokens with overlap_tokens carried over.
+    Chunk text is prefixed with its heading breadcrumb so it stays
+    self-describing when retrieved alone.
+
+    Returns:
+        [{"text", "section", "kind": "section"|"faq", "question", "answer"}]
+    """
+    chunks = []
+    for section in split_sections(markdown):
+        breadcrumb = " > ".join(section["headings"])
+        prefix = f"{breadcrumb}\n\n" if breadcrumb else ""
+        pairs, rest = split_faq(section["lines"])
+
+        body = "\n".join(line for line in rest if line.strip() != "---").strip()
+        if body:
+            for piece in _split_to_budget(body, max_tokens, overlap_tokens, count_tokens):
+                chunks.append({"text": prefix + piece, "section": breadcrumb, "kind": "section"})
+
+        for pair in pairs:
+            chunks.append({
+                "text": f"{prefix}Q: {pair['question']}\nA: {pair['answer']}",
+                "section": breadcrumb,
+                "kind": "faq",
+                "question": pair["question"],
+                "answer": pair["answer"],
+            })
+    return chunks
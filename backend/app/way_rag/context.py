@@ -0,0 +1,148 @@
+"""
+Token-budget context packing
+Splits a prompt token budget between chat history and retrieved chunks, dropping near-duplicate chunks
+"""
+import numpy as np
+from .chunking import estimate_tokens
+from .lexical import tokenize
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens=estimate_tokens) -> str:
+    """Cut text to roughly max_tokens (proportional cut, then trimmed until it fits)"""
+    if max_tokens <= 0:
+        return ""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = max(1, int(len(text) * max_tokens / tokens))
+    while cut > 1 and count_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut].rstrip() + "…"
+
+
+def hit_text(hit) -> str:
+    """What a hit contributes to the prompt: its ingest-time digest, else the raw chunk"""
+    return hit.payload.get("digest") or hit.payload.get("content", "")
+
+
+class ContextPacker:
+    """
+    Fill a token budget with chat history and retrieved chunks.
+
+    1. History gets up to `history_share` of the budget: a conversation
+       summary first (see summary.py), then messages newest first.
+    2. Chunks are ordered by MMR (relevance vs. similarity to chunks already
+       picked; cosine on the hit vectors, token overlap when a hit has no
+       vector) and near-duplicates above `duplicate_threshold` are dropped.
+    3. Chunks fill the remaining budget greedily; a chunk that does not fit
+       is skipped for smaller ones, except the first which is truncated.
+    4. Budget the chunks leave unused goes back to older history.
+    """
+
+    def __init__(self, budget_tokens: int = 1500, history_share: float = 0.35,
+                 mmr_lambda: float = 0.7, duplicate_threshold: float = 0.92,
+                 count_tokens=estimate_tokens):
+        self.budget_tokens = budget_tokens
+        self.history_share = history_share
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.count_tokens = count_tokens
+
+    def pack(self, history: list, hits: list, summary: str = None) -> dict:
+        """
+        Args:
+            history: prior messages [{"role", "content"}], oldest first
+            hits: retrieved hits, best first (payload, score, optional vector)
+            summary: summary of turns before `history`, if any
+
+        Returns:
+            {"summary", "history": kept messages (oldest first, oldest possibly
+             truncated), "hits": selected hits, "texts": their prompt texts,
+             "history_tokens" (summary included), "context_tokens"}
+        """
+        history_budget = int(self.budget_tokens * self.history_share)
+        summary_tokens = 0
+        if summary:
+            summary = truncate_to_tokens(summary, history_budget, self.count_tokens)
+            summary_tokens = self.count_tokens(summary) if summary else 0
+        kept, history_tokens = self._fit_history(history, history_budget - summary_tokens)
+        history_tokens += summary_tokens
+
+        hits_out, texts, context_tokens = [], [], 0
+        chunk_budget = self.budget_tokens - history_tokens
+        for hit in self._mmr_order(hits):
+            text = hit_text(hit)
+            tokens = self.count_tokens(text)
+            remaining = chunk_budget - context_tokens
+            if tokens > remaining:
+                if hits_out:
+                    continue
+                text = truncate_to_tokens(text, remaining, self.count_tokens)
+                if not text:
+                    break
+                tokens = self.count_tokens(text)
+            hits_out.append(hit)
+            texts.append(text)
+            context_tokens += tokens
+
+        leftover = self.budget_tokens - context_tokens
+        if leftover > history_tokens and len(kept) < len(history):
+            kept, history_tokens = self._fit_history(history, leftover - summary_tokens)
+            history_tokens += summary_tokens
+
+        return {
+            "summary": summary or None,
+            "history": kept,
+            "hits": hits_out,
+            "texts": texts,
+            "history_tokens": history_tokens,
+            "context_tokens": context_tokens,
+        }
+
+    def _fit_history(self, history: list, budget: int) -> tuple:
+        """Newest messages first; the oldest one that crosses the budget is truncated"""
+        kept, used = [], 0
+        for message in reversed(history):
+            content = message.get("content", "")
+            tokens = self.count_tokens(content)
+            if used + tokens > budget:
+                content = truncate_to_tokens(content, budget - used, self.count_tokens)
+                if content:
+                    kept.insert(0, {**message, "content": content})
+                    used += self.count_tokens(content)
+                break
+            kept.insert(0, message)
+            used += tokens
+        return kept, used
+
+    def _similarity(self, a, b) -> float:
+        if getattr(a, "vector", None) is not None and getattr(b, "vector", None) is not None:
+            va = np.asarray(a.vector, dtype=np.float32)
+            vb = np.asarray(b.vector, dtype=np.float32)
+            denom = float(np.linalg.norm(va) * np.linalg.norm(vb))
+            return float(va @ vb) / denom if denom else 0.0
+        ta, tb = set(tokenize(hit_text(a))), set(tokenize(hit_text(b)))
+        return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+    def _mmr_order(self, hits: list) -> list:
+        """Maximal marginal relevance order; relevance is rank-based so fused scores compare"""
+        if not hits:
+            return []
+        relevance = {id(hit): 1.0 - rank / len(hits) for rank, hit in enumerate(hits)}
+        remaining = list(hits)
+        ordered = []
+        while remaining:
+            best, best_score = None, None
+            for hit in list(remaining):
+                max_sim = max((self._similarity(hit, s) for s in ordered), default=0.0)
+                if max_sim >= self.duplicate_threshold:
+                    remaining.remove(hit)  # Near-duplicate of a chunk already picked
+                    continue
+                score = self.mmr_lambda * relevance[id(hit)] - (1 - self.mmr_lambda) * max_sim
+                if best_score is None or score > best_score:
+                    best, best_score = hit, score
+            if best is None:
+                break
+            ordered.append(best)
+            remaining.remove(best)
+        return ordered
@@ -0,0 +1,132 @@
+"""
+Chunk digests
+Compact key-fact summaries generated once at ingestion and put in prompts instead of raw chunk text
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+DIGEST_PROMPT = """You compress knowledge-base passages for a retrieval assistant.
+Rewrite the passage as a compact digest:
+- key facts, names, codes, URLs and numbers, verbatim
+- procedures as short numbered steps
+- for Q/A pairs, the answer in one or two sentences
+Keep the passage's language (Thai stays Thai). No preamble, no commentary.
+Return ONLY the digest."""
+
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+class Summarizer:
+    """Turns chunk texts into digests; implementations keep input order"""
+
+    name = "none"
+
+    def summarize(self, texts: list) -> list:
+        raise NotImplementedError
+
+
+class ExtractiveSummarizer(Summarizer):
+    """
+    Local, deterministic stand-in for the LLM summarizer (tests, offline runs).
+
+    Keeps FAQ answers, list items and the leading sentence of each
+    paragraph, within max_chars.
+    """
+
+    name = "local"
+
+    def __init__(self, max_chars: int = 400):
+        self.max_chars = max_chars
+
+    def summarize(self, texts: list) -> list:
+        return [self._digest(text) for text in texts]
+
+    def _digest(self, text: str) -> str:
+        # Drop the heading breadcrumb; payloads keep it in "section"
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+        if len(paragraphs) > 1 and "\n" not in paragraphs[0] and not paragraphs[0].startswith("Q:"):
+            paragraphs = paragraphs[1:]
+
+        facts = []
+        for paragraph in paragraphs:
+            for line in paragraph.splitlines():
+                line = line.strip()
+                if line.startswith("A:"):
+                    facts.append(line[2:].strip())
+                elif _LIST_ITEM.match(line):
+                    facts.append(line)
+            if not any(_LIST_ITEM.match(l) or l.strip().startswith(("Q:", "A:")) for l in paragraph.splitlines()):
+                facts.append(_SENTENCE.split(paragraph.replace("\n", " "))[0])
+
+        digest = ""
+        for fact in facts:
+            candidate = f"{digest}\n{fact}" if digest else fact
+            if len(candidate) > self.max_chars:
+                break
+            digest = candidate
+        return digest or text[:self.max_chars]
+
+
+class GroqSummarizer(Summarizer):
+    """LLM digests through a (blocking) Groq client, `workers` requests at a time"""
+
+    name = "groq"
+
+    def __init__(self, client, model: str = "llama-3.1-8b-instant", max_tokens: int = 200, workers: int = 4):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.workers = workers
+
+    def summarize(self, texts: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self._summarize_one, texts))
+
+    def _summarize_one(self, text: str) -> str:
+        try:
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": DIGEST_PROMPT},
+                    {"role": "user", "content": text},
+                ],
+                temperature=0,
+                max_tokens=self.max_tokens,
+            )
+            return completion.choices[0].message.content.strip()
+        except Exception as e:
+            # No digest: the engine falls back to the raw chunk text
+            print(f"⚠️ Digest Error: {e}")
+            return ""
+
+
+def create_summarizer(kind: str = None):
+    """
+    Build the configured summarizer.
+
+    Env:
+        INGEST_DIGEST: none (default) | local | groq
+        INGEST_DIGEST_MODEL / INGEST_DIGEST_MAX_TOKENS / INGEST_DIGEST_WORKERS: groq settings
+
+    Returns:
+        Summarizer, or None when digests are disabled
+    """
+    kind = kind or os.getenv("INGEST_DIGEST", "none")
+    if kind == "none":
+        return None
+    if kind == "local":
+        return ExtractiveSummarizer()
+    if kind == "groq":
+        from groq import Groq
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("INGEST_DIGEST=groq needs GROQ_API_KEY")
+        return GroqSummarizer(
+            Groq(api_key=api_key),
+            model=os.getenv("INGEST_DIGEST_MODEL", "llama-3.1-8b-instant"),
+            max_tokens=int(os.getenv("INGEST_DIGEST_MAX_TOKENS", "200")),
+            workers=int(os.getenv("INGEST_DIGEST_WORKERS", "4")),
+        )
+    raise ValueError(f"Unknown INGEST_DIGEST '{kind}' (expected none, local or groq)")
@@ -0,0 +1,130 @@
+"""
+Query embedding off the event loop
+Runs fastembed inference on a dedicated executor behind a normalized-query LRU cache,
+micro-batching concurrent cache misses into one embed() call
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache import LRUCache
+from .text import normalize_query
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embed requests and runs them as one batched call.
+
+    A batch is flushed when it reaches max_batch_size or max_wait_ms after its
+    first request arrived, whichever comes first. Each caller awaits its own
+    future; identical texts within a batch are embedded once.
+    """
+
+    def __init__(self, embed_fn, executor, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []  # (text, future)
+        self._timer = None
+        # asyncio only keeps weak references to tasks: hold in-flight batches here
+        self._tasks = set()
+        self.batch_count = 0
+        self.item_count = 0
+
+    async def submit(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size or self.max_wait <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batch_count += 1
+        self.item_count += len(texts)
+        loop = asyncio.get_running_loop()
+        try:
+            vectors = await loop.run_in_executor(self.executor, self.embed_fn, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batch_count,
+            "avg_batch_size": round(self.item_count / self.batch_count, 2) if self.batch_count else 0.0,
+        }
+
+
+class QueryEmbedder:
+    """Async, cached wrapper around a fastembed TextEmbedding model"""
+
+    def __init__(self, model, max_workers: int = 1, cache_size: int = 2048,
+                 batch_size: int = 16, batch_wait_ms: float = 5.0):
+        self.model = model
+        # ONNX Runtime releases the GIL, so a thread pool keeps the loop responsive
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+        self.batcher = EmbeddingBatcher(
+            self._embed_sync, self.executor,
+            max_batch_size=batch_size, max_wait_ms=batch_wait_ms,
+        )
+        self.cache = LRUCache(maxsize=cache_size)
+        self.embed_count = 0
+        self.embed_ms_total = 0.0
+        self.last_embed_ms = 0.0
+
+    def _embed_sync(self, texts: list) -> list:
+        return list(self.model.embed(texts, batch_size=len(texts)))
+
+    async def embed(self, query: str):
+        """Return the vector for query, computing it on the executor on a cache miss"""
+        key = normalize_query(query)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+
+        start = time.perf_counter()
+        vector = await self.batcher.submit(key)
+        self._record_latency((time.perf_counter() - start) * 1000)
+
+        self.cache.put(key, vector)
+        return vector
+
+    def _record_latency(self, elapsed_ms: float):
+        self.embed_count += 1
+        self.embed_ms_total += elapsed_ms
+        self.last_embed_ms = elapsed_ms
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        stats.update({
+            "embeds": self.embed_count,
+            "avg_embed_ms": round(self.embed_ms_total / self.embed_count, 2) if self.embed_count else 0.0,
+            "last_embed_ms": round(self.last_embed_ms, 2),
+        })
+        stats.update(self.batcher.stats())
+        return stats
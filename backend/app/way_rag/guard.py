@@ -0,0 +1,100 @@
+"""
+Layer 0 guard
+Blocks requests on configured patterns before any history formatting, embedding or retrieval
+"""
+import os
+import re
+import json
+import asyncio
+from pathlib import Path
+from ..utils.matcher import KeywordMatcher, fold_text
+
+DEFAULT_GUARD_PATTERNS = Path(__file__).parent.parent / "data" / "guard_patterns.json"
+# English endings that still count as the phrase ("hack" -> "hacked", "hackers")
+INFLECTIONS = ("s", "es", "d", "ed", "ing", "er", "ers")
+
+
+class Guard:
+    """
+    The "reflex" layer: every user message of a conversation is folded
+    (see fold_text: Thai, homoglyphs, zero-width characters) and scanned
+    once by an Aho-Corasick automaton over all phrases, plus one combined
+    regex for the patterns that are not plain phrases. Scanning cost does
+    not grow with the number of phrases.
+
+    Latin phrases match whole words only ("hack" does not block "hackathon"),
+    inflected forms included ("hacking", "hacked", "bypassing").
+    Assistant messages are not scanned: an answer quoting a phrase must not
+    block the rest of the conversation.
+    """
+
+    def __init__(self, phrases=(), regex=(), reply: str = "I cannot fulfill this request due to safety guidelines.",
+                 inline_chars: int = 8192):
+        self.reply = reply
+        self.inline_chars = inline_chars
+        self.matcher = KeywordMatcher(
+            ((phrase, phrase) for phrase in phrases), word_boundaries=True, suffixes=INFLECTIONS,
+        )
+        regex = list(regex)
+        self.regex = re.compile("|".join(f"(?:{r})" for r in regex)) if regex else None
+        self.scanned = 0
+        self.blocked = 0
+
+    @classmethod
+    def load(cls, path, **kwargs) -> "Guard":
+        """Guard from a JSON file {"reply", "phrases": [...], "regex": [...]}"""
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        if config.get("reply"):
+            kwargs["reply"] = config["reply"]
+        return cls(config.get("phrases", []), config.get("regex", []), **kwargs)
+
+    def scan(self, text: str):
+        """The pattern that blocks this text, or None"""
+        text = fold_text(text)
+        match = self.matcher.first(text, normalized=True)
+        if match is not None:
+            return match[3][0]
+        if self.regex is not None:
+            found = self.regex.search(text)
+            if found:
+                return found.group(0)
+        return None
+
+    def check(self, messages: list):
+        """The first blocking pattern in any user message of the conversation, or None"""
+        self.scanned += 1
+        for message in messages:
+            if message.get("role") != "user":
+                continue
+            pattern = self.scan(message.get("content", ""))
+            if pattern is not None:
+                self.blocked += 1
+                return pattern
+        return None
+
+    async def check_async(self, messages: list):
+        """check() for the event loop: user text over inline_chars is scanned on a thread"""
+        size = sum(len(m.get("content", "")) for m in messages if m.get("role") == "user")
+        if size <= self.inline_chars:
+            return self.check(messages)
+        return await asyncio.to_thread(self.check, messages)
+
+    def check_batch(self, conversations: list) -> list:
+        """check() for many conversations (moderation backfills, load tests)"""
+        return [self.check(messages) for messages in conversations]
+
+    def stats(self) -> dict:
+        return {"patterns": len(self.matcher), "scanned": self.scanned, "blocked": self.blocked}
+
+
+def create_guard(path: str = None) -> Guard:
+    """
+    Env:
+        GUARD_PATTERNS_PATH: pattern file (default app/data/guard_patterns.json)
+        GUARD_INLINE_CHARS: user text scanned on the event loop; longer runs on a thread (default 8192)
+    """
+    return Guard.load(
+        path or os.getenv("GUARD_PATTERNS_PATH") or DEFAULT_GUARD_PATTERNS,
+        inline_chars=int(os.getenv("GUARD_INLINE_CHARS", "8192")),
+    )
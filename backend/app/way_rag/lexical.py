@@ -0,0 +1,186 @@
+"""
+Lexical retrieval
+Thai-aware tokenizer, in-memory BM25 inverted index and reciprocal-rank fusion
+"""
+import re
+import json
+import math
+from collections import Counter, defaultdict
+from pathlib import Path
+from .text import normalize_query
+from .vector_store import SearchHit, DATA_DIR, payload_matches
+
+try:  # Optional: dictionary-based Thai word segmentation
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:
+    _thai_word_tokenize = None
+
+# Recorded with a saved index: Thai tokens from one tokenizer never match the other's
+TOKENIZER = "newmm" if _thai_word_tokenize is not None else "bigram"
+
+_THAI_RUN = re.compile("[\u0e00-\u0e7f]+")
+_CODE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_CODE_QUERY = re.compile(r"^[A-Z]{2,}(?:-\d+)?$|^[A-Z]+-\d+$")
+
+
+class TokenizerMismatchError(ValueError):
+    """A saved index was built with a different Thai tokenizer than this runtime has"""
+
+
+def default_index_path(collection_name: str = "mango_kb") -> Path:
+    return DATA_DIR / "lexical_index" / f"{collection_name}.json"
+
+
+def _thai_tokens(run: str) -> list:
+    """Words via pythainlp when installed, otherwise overlapping character bigrams"""
+    if _thai_word_tokenize is not None:
+        return [w for w in _thai_word_tokenize(run, engine="newmm") if w.strip()]
+    if len(run) <= 2:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> list:
+    """
+    Tokenize mixed Thai/English text for BM25.
+
+    Latin runs are lowercased; codes such as "MAT-001" are kept whole and
+    also split into their parts ("mat", "001") so both forms match.
+    """
+    text = normalize_query(text).lower()
+    tokens = []
+    for run in _THAI_RUN.findall(text):
+        tokens.extend(_thai_tokens(run))
+    for code in _CODE.findall(_THAI_RUN.sub(" ", text)):
+        tokens.append(code)
+        parts = re.split(r"[-_./]", code)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def is_exact_term_query(query: str) -> bool:
+    """Short queries made only of codes like "BD", "PO" or "MAT-001" (case-sensitive caps)"""
+    terms = normalize_query(query).rstrip("?").split()
+    return 0 < len(terms) <= 3 and all(_CODE_QUERY.match(t) for t in terms)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk text plus a boosted `keywords` field.
+
+    Documents are keyed by point ID (same IDs as the vector store) and carry
+    their payload, so lexical hits can be used directly as prompt context.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, keyword_boost: float = 3.0, tokenizer: str = TOKENIZER):
+        self.k1 = k1
+        self.b = b
+        self.keyword_boost = keyword_boost
+        self.tokenizer = tokenizer
+        self.docs = {}  # id -> {"tf": {token: weight}, "length": float, "payload": {...}}
+        self._postings = None
+
+    def add(self, doc_id, text: str, payload: dict, keywords=()):
+        tf = Counter(tokenize(text))
+        for keyword in keywords:
+            for token in tokenize(keyword):
+                tf[token] += self.keyword_boost
+        self.docs[doc_id] = {"tf": dict(tf), "length": float(sum(tf.values())), "payload": payload}
+        self._postings = None
+
+    def remove_paths(self, rel_paths):
+        rel_paths = set(rel_paths)
+        self.docs = {i: d for i, d in self.docs.items() if d["payload"].get("path") not in rel_paths}
+        self._postings = None
+
+    def _build(self):
+        postings = defaultdict(list)
+        for doc_id, doc in self.docs.items():
+            for token, weight in doc["tf"].items():
+                postings[token].append((doc_id, weight))
+        n = len(self.docs)
+        self._idf = {
+            token: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for token, plist in postings.items()
+        }
+        self._avgdl = (sum(d["length"] for d in self.docs.values()) / n) if n else 0.0
+        self._postings = postings
+
+    def search(self, query: str, limit: int = 10, filters: dict = None) -> list:
+        """BM25 top hits; filters ({field: value}) restricts to matching payloads"""
+        if not self.docs:
+            return []
+        if self._postings is None:
+            self._build()
+
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            plist = self._postings.get(token)
+            if not plist:
+                continue
+            idf = self._idf[token]
+            for doc_id, tf in plist:
+                dl = self.docs[doc_id]["length"]
+                denom = tf + self.k1 * (1 - self.b + self.b * dl / self._avgdl)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / denom
+
+        if filters:
+            scores = {i: s for i, s in scores.items() if payload_matches(self.docs[i]["payload"], filters)}
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [SearchHit(doc_id, score, self.docs[doc_id]["payload"]) for doc_id, score in top]
+
+    def __len__(self):
+        return len(self.docs)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "params": {
+                "k1": self.k1, "b": self.b, "keyword_boost": self.keyword_boost, "tokenizer": self.tokenizer,
+            },
+            "docs": self.docs,
+        }, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a saved index; a missing file gives an empty index.
+
+        Raises TokenizerMismatchError when the index was tokenized differently
+        from queries here (or predates the tokenizer being recorded).
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        data = json.loads(path.read_text(encoding="utf-8"))
+        params = dict(data["params"])
+        saved = params.pop("tokenizer", None)
+        if saved != TOKENIZER:
+            raise TokenizerMismatchError(
+                f"{path.name} was built with the {saved or 'unrecorded'} Thai tokenizer, runtime has {TOKENIZER}"
+            )
+        index = cls(**params)
+        index.docs = data["docs"]
+        return index
+
+
+def reciprocal_rank_fusion(result_lists: list, limit: int = 3, k: int = 60) -> list:
+    """
+    Merge ranked hit lists: score(d) = sum over lists of 1 / (k + rank).
+
+    Returns SearchHits carrying the fused score, the first payload seen and
+    the first vector seen (lexical hits have none).
+    """
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit.id, [0.0, hit.payload, None])
+            entry[0] += 1.0 / (k + rank)
+            if entry[2] is None:
+                entry[2] = getattr(hit, "vector", None)
+    top = sorted(fused.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return [SearchHit(doc_id, score, payload, vector) for doc_id, (score, payload, vector) in top]
@@ -0,0 +1,78 @@
+"""
+Groq client factory and response parsing
+One pooled, kept-alive AsyncGroq client is shared by every request of an engine
+"""
+import os
+import re
+import json
+import httpx
+from groq import AsyncGroq
+
+
+def create_groq_client():
+    """
+    Build the long-lived async Groq client from environment settings.
+
+    Env:
+        GROQ_MAX_CONNECTIONS: connection-pool size (default 20)
+        GROQ_MAX_KEEPALIVE: idle connections kept open (default 10)
+        GROQ_KEEPALIVE_EXPIRY: seconds an idle connection stays open (default 30)
+        GROQ_CONNECT_TIMEOUT: TCP/TLS connect timeout in seconds (default 5)
+
+    Returns:
+        AsyncGroq instance, or None when GROQ_API_KEY is not set
+    """
+    groq_key = os.getenv("GROQ_API_KEY")
+    if not groq_key:
+        return None
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("GROQ_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30")),
+    )
+    # Read/write timeouts are set per call; this is only the transport default
+    timeout = httpx.Timeout(60.0, connect=float(os.getenv("GROQ_CONNECT_TIMEOUT", "5")))
+    http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return AsyncGroq(api_key=groq_key, http_client=http_client)
+
+
+STRUCTURED_ANSWER_INSTRUCTIONS = """Reply with ONE JSON object and nothing else:
+{"answer": "<your answer, markdown allowed>", "suggestions": ["<follow-up question>", "<follow-up question>", "<follow-up question>"]}
+The suggestions are 3 short questions the user might ask next, in the user's language."""
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def parse_structured_answer(text: str):
+    """
+    Parse {"answer", "suggestions"} model output.
+
+    Tolerates code fences and prose around the object, and suggestions
+    given as one newline-separated string.
+
+    Returns:
+        (answer, suggestions[:3]), or None when the output is unusable
+    """
+    if not text:
+        return None
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    answer = data.get("answer")
+    if not isinstance(answer, str) or not answer.strip():
+        return None
+    suggestions = data.get("suggestions") or []
+    if isinstance(suggestions, str):
+        suggestions = suggestions.split("\n")
+    if not isinstance(suggestions, list):
+        suggestions = []
+    suggestions = [q.strip() for q in suggestions if isinstance(q, str) and q.strip()]
+    return answer.strip(), suggestions[:3]
@@ -0,0 +1,115 @@
+"""
+Semantic answer cache
+Reuses LLM answers for paraphrased questions that retrieve the same documents
+"""
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Rough per-entry bookkeeping cost on top of the vector and the answer text
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class SemanticCache:
+    """
+    LRU + TTL cache of answers keyed by query vector and retrieved doc IDs.
+
+    A lookup hits when a cached query has cosine similarity >= threshold with
+    the new query vector AND was answered from exactly the same doc IDs, so a
+    paraphrase only reuses an answer grounded in the same context.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000,
+                 ttl_seconds: float = 3600, max_bytes: int = 16 * 1024 * 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # entry_id -> entry dict, oldest first
+        self._by_docs = {}             # doc_ids tuple -> set of entry_ids
+        self._next_id = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, vector, doc_ids) -> str | None:
+        """Return a cached answer for a similar query over the same docs, or None"""
+        key = tuple(doc_ids)
+        candidates = self._by_docs.get(key)
+        if not candidates:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        query = self._normalize(vector)
+        best_id, best_score = None, self.threshold
+        for entry_id in list(candidates):
+            entry = self._entries[entry_id]
+            if now - entry["created_at"] > self.ttl_seconds:
+                self._remove(entry_id)
+                continue
+            score = float(np.dot(query, entry["vector"]))
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id]["answer"]
+
+    def store(self, vector, doc_ids, answer: str):
+        """Cache an answer, evicting least recently used entries past the caps"""
+        vec = self._normalize(vector)
+        size = vec.nbytes + len(answer.encode("utf-8")) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        entry_id = self._next_id
+        self._next_id += 1
+        key = tuple(doc_ids)
+        self._entries[entry_id] = {
+            "vector": vec,
+            "doc_ids": key,
+            "answer": answer,
+            "size": size,
+            "created_at": time.monotonic(),
+        }
+        self._by_docs.setdefault(key, set()).add(entry_id)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry["size"]
+        bucket = self._by_docs[entry["doc_ids"]]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._by_docs[entry["doc_ids"]]
+
+    def clear(self):
+        self._entries.clear()
+        self._by_docs.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
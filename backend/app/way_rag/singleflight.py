@@ -0,0 +1,36 @@
+"""
+Single-flight request coalescing
+Concurrent calls with the same key share one in-flight computation
+"""
+import asyncio
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent identical work.
+
+    The first caller for a key starts the computation as a task; callers
+    arriving while it runs await the same task. Each caller waits through
+    asyncio.shield, so one client disconnecting does not cancel the result
+    the others are waiting for. Nothing is kept once the task finishes
+    (that is what the caches are for).
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, coro_fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(coro_fn())
+            self._inflight[key] = task
+            self.started += 1
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "started": self.started, "shared": self.shared}
@@ -0,0 +1,96 @@
+"""
+Rolling conversation summaries
+Older turns of long chats are folded into a cached summary that is extended, not regenerated
+"""
+import asyncio
+import hashlib
+from .cache import LRUCache
+
+
+def prefix_hashes(messages: list) -> list:
+    """
+    Chained hashes: entry i identifies messages[:i + 1], so a conversation
+    and every one of its prefixes can be looked up without re-hashing.
+    """
+    hashes, digest = [], b""
+    for message in messages:
+        h = hashlib.sha256(digest)
+        h.update(message.get("role", "").encode("utf-8"))
+        h.update(b"\x00")
+        h.update(message.get("content", "").encode("utf-8"))
+        digest = h.digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+class ConversationSummarizer:
+    """
+    Keeps the last `keep_recent` messages verbatim once a history grows past
+    `trigger_messages`, and replaces everything before them with a summary.
+
+    Summaries are cached under the hash of the prefix they cover. A request
+    uses the longest cached prefix and sends the few messages after it
+    verbatim; extending the summary over those messages runs in the
+    background (summarize_fn(previous_summary, new_messages)), so the LLM
+    call never sits in front of an answer.
+    """
+
+    def __init__(self, summarize_fn, trigger_messages: int = 8, keep_recent: int = 4,
+                 cache_size: int = 1024, ttl_seconds: float = 86400):
+        self.summarize_fn = summarize_fn
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.cache = LRUCache(cache_size, ttl_seconds=ttl_seconds)
+        self._pending = {}  # prefix hash -> task extending the summary to that prefix
+        self.updates = 0
+
+    def condense(self, history: list) -> tuple:
+        """
+        Returns:
+            (summary or None, messages not covered by the summary, oldest first)
+        """
+        if len(history) <= self.trigger_messages:
+            return None, history
+
+        older = history[:-self.keep_recent]
+        hashes = prefix_hashes(older)
+        covered, summary = 0, None
+        for k in range(len(older), 0, -1):
+            if hashes[k - 1] in self.cache:
+                summary = self.cache.get(hashes[k - 1])
+                if summary is not None:
+                    covered = k
+                    break
+
+        if covered < len(older):
+            self._schedule(hashes[-1], summary, older[covered:])
+        return summary, history[covered:]
+
+    def _schedule(self, key: str, summary, new_messages: list):
+        if key in self._pending:
+            return
+        task = asyncio.create_task(self._update(key, summary, new_messages))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _update(self, key: str, summary, new_messages: list):
+        try:
+            updated = await self.summarize_fn(summary, new_messages)
+        except Exception as e:
+            print(f"Summary Error: {e}")
+            return
+        if updated:
+            self.cache.put(key, updated)
+            self.updates += 1
+
+    async def wait(self):
+        """Wait for in-flight summary updates (tests, shutdown)"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending.values()), return_exceptions=True)
+
+    def cancel(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "updates": self.updates, "pending": len(self._pending)}
@@ -0,0 +1,22 @@
+"""
+Text normalization helpers
+Shared cache-key normalization for user queries (Thai-safe)
+"""
+import re
+import unicodedata
+
+# Zero-width space/joiners, word joiner and BOM show up in copy-pasted Thai text
+_ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query so that visually identical inputs share one cache key.
+
+    Applies Unicode NFC (Thai sara am / tone mark ordering), strips zero-width
+    characters and collapses runs of whitespace.
+    """
+    text = unicodedata.normalize("NFC", text)
+    text = _ZERO_WIDTH.sub("", text)
+    return _WHITESPACE.sub(" ", text).strip()
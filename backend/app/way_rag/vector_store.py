@@ -0,0 +1,481 @@
+"""
+Vector store backends for WAYRAGEngine and the ingestion script
+
+- QdrantVectorStore("qdrant"): remote Qdrant server (default), searched with the async client over REST or gRPC
+- QdrantVectorStore("qdrant-local"): embedded Qdrant local mode on a disk path
+- NumpyVectorStore("numpy"): in-process brute-force index over a memory-mapped matrix
+"""
+import os
+import json
+import shutil
+import asyncio
+import threading
+from pathlib import Path
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams,
+    Filter, FieldCondition, MatchAny, MatchValue, FilterSelector, PayloadSchemaType,
+)
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# Payload fields with a keyword index: deletes by path, scoped searches by department/module
+PAYLOAD_INDEX_FIELDS = ("path", "department", "module")
+
+
+def payload_matches(payload: dict, filters: dict) -> bool:
+    """Exact-match payload filter shared by the in-process indexes ({} / None match all)"""
+    return all(payload.get(key) == value for key, value in (filters or {}).items())
+
+
+class SearchHit:
+    """Search result with the same attributes as Qdrant's ScoredPoint"""
+
+    __slots__ = ("id", "score", "payload", "vector")
+
+    def __init__(self, id, score: float, payload: dict, vector=None):
+        self.id = id
+        self.score = score
+        self.payload = payload
+        self.vector = vector
+
+
+class VectorStore:
+    """
+    Interface shared by all backends.
+
+    Read side (engine): search(), index_version(), reload().
+    Write side (ingestion): recreate(), exists(), delete_paths(), upsert(), finalize(),
+    set_index_version().
+    """
+
+    # Backends that cannot delete/replace points in place are always rebuilt in full
+    supports_incremental = True
+
+    async def search(self, vector, limit: int = 3, with_vectors: bool = False, filters: dict = None) -> list:
+        """
+        Top hits by cosine similarity; with_vectors also returns each hit's
+        stored vector, filters ({field: value}) restricts to matching payloads
+        """
+        raise NotImplementedError
+
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    def recreate(self, vector_size: int):
+        raise NotImplementedError
+
+    def delete_paths(self, rel_paths: list):
+        raise NotImplementedError
+
+    def upsert(self, points: list):
+        """Store points (objects with .id, .vector and .payload)"""
+        raise NotImplementedError
+
+    def finalize(self):
+        """Make everything written since recreate() visible to readers"""
+
+    def ensure_payload_indexes(self):
+        """Create missing payload indexes (PAYLOAD_INDEX_FIELDS) on an existing index"""
+
+    def iter_vectors(self, batch_size: int = 256):
+        """Yield (vector, payload) for every stored point (ingestion-time aggregates)"""
+        raise NotImplementedError
+
+    async def index_version(self):
+        """Marker written by the last completed ingestion (None if never set)"""
+        return None
+
+    def set_index_version(self, version: str):
+        """Publish a new marker so engines drop results cached from the old index"""
+
+    def reload(self):
+        """Pick up an index rewritten by another process"""
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        """Async variant of close() for the engine's shutdown hook"""
+        self.close()
+
+
+# Local-mode storage can only be opened by one client per process: stores of
+# several collections on the same path share it (path -> [client, users])
+_local_clients = {}
+_local_clients_lock = threading.Lock()
+
+
+def _open_local_client(path: str) -> QdrantClient:
+    key = os.path.abspath(path)
+    with _local_clients_lock:
+        entry = _local_clients.get(key)
+        if entry is None:
+            entry = _local_clients[key] = [QdrantClient(path=path), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _close_local_client(path: str):
+    key = os.path.abspath(path)
+    with _local_clients_lock:
+        entry = _local_clients.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _local_clients[key]
+            entry[0].close()
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    Qdrant server (url) or embedded local mode (path, single process only).
+
+    The blocking client serves the write side (ingestion). Server searches go
+    through a lazily created AsyncQdrantClient, optionally over gRPC, so the
+    engine does not spend an executor thread per query. Local mode keeps the
+    blocking client for both, since its storage can only be opened once; that
+    client is shared by every collection stored on the same path.
+    """
+
+    def __init__(self, collection_name: str, url: str = None, api_key: str = None, path: str = None,
+                 prefer_grpc: bool = False, grpc_port: int = 6334, pool_size: int = None, timeout: int = None):
+        self.collection_name = collection_name
+        self.path = path
+        if path:
+            self.client = _open_local_client(path)
+        else:
+            self.client = QdrantClient(url=url, api_key=api_key, timeout=timeout)
+        self._async_options = {
+            "url": url,
+            "api_key": api_key,
+            "prefer_grpc": prefer_grpc,
+            "grpc_port": grpc_port,
+            "pool_size": pool_size,
+            "timeout": timeout,
+            # The blocking client already checked; skip a second (blocking) version request
+            "check_compatibility": False,
+        }
+        self._async_client = None
+
+    def _get_async_client(self):
+        # Created on first use so gRPC channels bind to the serving event loop
+        if self._async_client is None:
+            self._async_client = AsyncQdrantClient(**self._async_options)
+        return self._async_client
+
+    async def search(self, vector, limit: int = 3, with_vectors: bool = False, filters: dict = None) -> list:
+        query_filter = None
+        if filters:
+            query_filter = Filter(must=[
+                FieldCondition(key=key, match=MatchValue(value=value)) for key, value in filters.items()
+            ])
+        if self.path:
+            # Run blocking local-mode call in thread pool
+            result = await asyncio.to_thread(
+                self.client.query_points,
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=query_filter,
+                limit=limit,
+                with_vectors=with_vectors,
+            )
+        else:
+            result = await self._get_async_client().query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=query_filter,
+                limit=limit,
+                with_vectors=with_vectors,
+            )
+        return result.points
+
+    def exists(self) -> bool:
+        return self.client.collection_exists(self.collection_name)
+
+    def recreate(self, vector_size: int):
+        if self.client.collection_exists(self.collection_name):
+            self.client.delete_collection(self.collection_name)
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+        )
+        self.ensure_payload_indexes()
+
+    def ensure_payload_indexes(self):
+        existing = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field in PAYLOAD_INDEX_FIELDS:
+            if field not in existing:
+                self.client.create_payload_index(self.collection_name, field, field_schema=PayloadSchemaType.KEYWORD)
+
+    async def index_version(self):
+        # Stored in the collection's metadata, so every engine replica sees it
+        if self.path:
+            info = await asyncio.to_thread(self.client.get_collection, self.collection_name)
+        else:
+            info = await self._get_async_client().get_collection(self.collection_name)
+        return (info.config.metadata or {}).get("index_version")
+
+    def iter_vectors(self, batch_size: int = 256):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection_name, limit=batch_size, offset=offset, with_vectors=True, with_payload=True,
+            )
+            for point in points:
+                yield point.vector, point.payload
+            if offset is None:
+                return
+
+    def set_index_version(self, version: str):
+        self.client.update_collection(self.collection_name, metadata={"index_version": version})
+
+    def delete_paths(self, rel_paths: list):
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(
+                filter=Filter(must=[FieldCondition(key="path", match=MatchAny(any=rel_paths))])
+            ),
+        )
+
+    def upsert(self, points: list):
+        self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+
+    def close(self):
+        if self.client is None:
+            return
+        if self.path:
+            _close_local_client(self.path)
+        else:
+            self.client.close()
+        self.client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        self.close()
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Brute-force cosine index kept in a memory-mapped float32/float16 matrix.
+
+    Layout of `path/`:
+        meta.json       {"count", "dim", "dtype"}
+        vectors.bin     count x dim row-major, L2-normalized
+        ids.json        point IDs, row order
+        payloads.jsonl  one payload per row
+
+    Every worker process maps the same vectors.bin read-only, so the OS page
+    cache holds one copy. Writes go to a sibling `.building` directory that
+    finalize() compacts and swaps in, so readers never see a partial index.
+    """
+
+    supports_incremental = False
+
+    def __init__(self, path, dtype: str = "float32"):
+        self.path = Path(path)
+        self.build_path = self.path.with_name(self.path.name + ".building")
+        self.dtype = np.dtype(dtype)
+        self._write_lock = threading.Lock()
+        self._matrix = None
+        self._ids = []
+        self._payloads = []
+        self._filter_rows = {}  # filter items -> matching row numbers
+        self.load()
+
+    # ---------- read side ----------
+
+    def load(self):
+        """(Re)map the index from disk; a missing index searches as empty"""
+        self._filter_rows = {}
+        meta_file = self.path / "meta.json"
+        if not meta_file.exists():
+            self._matrix, self._ids, self._payloads = None, [], []
+            return
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        if meta["count"]:
+            self._matrix = np.memmap(
+                self.path / "vectors.bin", dtype=np.dtype(meta["dtype"]),
+                mode="r", shape=(meta["count"], meta["dim"]),
+            )
+        else:
+            self._matrix = None
+        self._ids = json.loads((self.path / "ids.json").read_text(encoding="utf-8"))
+        with open(self.path / "payloads.jsonl", encoding="utf-8") as f:
+            self._payloads = [json.loads(line) for line in f]
+
+    def reload(self):
+        self.load()
+
+    async def index_version(self):
+        meta_file = self.path / "meta.json"
+        if not meta_file.exists():
+            return None
+        return json.loads(meta_file.read_text(encoding="utf-8")).get("index_version")
+
+    def _rows_for(self, filters: dict):
+        key = tuple(sorted(filters.items()))
+        rows = self._filter_rows.get(key)
+        if rows is None:
+            rows = np.asarray([i for i, payload in enumerate(self._payloads) if payload_matches(payload, filters)],
+                              dtype=np.int64)
+            self._filter_rows[key] = rows
+        return rows
+
+    def search_sync(self, vector, limit: int = 3, with_vectors: bool = False, filters: dict = None) -> list:
+        if self._matrix is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        query = query.astype(self._matrix.dtype)
+        if filters:
+            # Only the matching rows are scored
+            rows = self._rows_for(filters)
+            if not len(rows):
+                return []
+            scores = self._matrix[rows] @ query
+        else:
+            rows = None
+            scores = self._matrix @ query
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(self._ids[i], float(scores[j]), self._payloads[i],
+                      np.asarray(self._matrix[i], dtype=np.float32) if with_vectors else None)
+            for j, i in zip(top, top if rows is None else rows[top])
+        ]
+
+    async def search(self, vector, limit: int = 3, with_vectors: bool = False, filters: dict = None) -> list:
+        # Microseconds for a KB-sized matrix: cheaper inline than a thread hop
+        return self.search_sync(vector, limit, with_vectors, filters)
+
+    def iter_vectors(self, batch_size: int = 256):
+        if self._matrix is None:
+            return
+        for start in range(0, len(self._ids), batch_size):
+            block = np.asarray(self._matrix[start:start + batch_size], dtype=np.float32)
+            for vector, payload in zip(block, self._payloads[start:start + batch_size]):
+                yield vector, payload
+
+    # ---------- write side ----------
+
+    def exists(self) -> bool:
+        return (self.path / "meta.json").exists()
+
+    def recreate(self, vector_size: int):
+        shutil.rmtree(self.build_path, ignore_errors=True)
+        self.build_path.mkdir(parents=True)
+        (self.build_path / "build.json").write_text(
+            json.dumps({"dim": vector_size, "dtype": self.dtype.name}), encoding="utf-8"
+        )
+
+    def delete_paths(self, rel_paths: list):
+        raise NotImplementedError("NumpyVectorStore is rebuilt in full; use --full")
+
+    def set_index_version(self, version: str):
+        meta_file = self.path / "meta.json"
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        meta["index_version"] = version
+        tmp = meta_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        tmp.replace(meta_file)
+
+    def upsert(self, points: list):
+        vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = (vectors / np.where(norms == 0, 1, norms)).astype(self.dtype)
+        with self._write_lock:
+            with open(self.build_path / "vectors.bin", "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.build_path / "rows.jsonl", "a", encoding="utf-8") as f:
+                for p in points:
+                    f.write(json.dumps({"id": p.id, "payload": p.payload}, ensure_ascii=False) + "\n")
+
+    def finalize(self):
+        """Compact the build (last write per ID wins, so resumed runs are safe) and swap it in"""
+        build = json.loads((self.build_path / "build.json").read_text(encoding="utf-8"))
+        rows_file = self.build_path / "rows.jsonl"
+        rows = []
+        if rows_file.exists():
+            with open(rows_file, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        # A torn final write may leave fewer vector rows than metadata rows
+        vectors_file = self.build_path / "vectors.bin"
+        row_bytes = build["dim"] * self.dtype.itemsize
+        vector_rows = vectors_file.stat().st_size // row_bytes if vectors_file.exists() else 0
+        rows = rows[:vector_rows]
+
+        last_row = {}
+        for i, row in enumerate(rows):
+            last_row[row["id"]] = i
+        keep = sorted(last_row.values())
+
+        out_dir = self.path.with_name(self.path.name + ".new")
+        shutil.rmtree(out_dir, ignore_errors=True)
+        out_dir.mkdir(parents=True)
+        if keep:
+            source = np.memmap(vectors_file, dtype=self.dtype, mode="r", shape=(vector_rows, build["dim"]))
+            target = np.memmap(out_dir / "vectors.bin", dtype=self.dtype, mode="w+", shape=(len(keep), build["dim"]))
+            for start in range(0, len(keep), 4096):
+                block = keep[start:start + 4096]
+                target[start:start + len(block)] = source[block]
+            target.flush()
+            del source, target
+        (out_dir / "ids.json").write_text(json.dumps([rows[i]["id"] for i in keep]), encoding="utf-8")
+        with open(out_dir / "payloads.jsonl", "w", encoding="utf-8") as f:
+            for i in keep:
+                f.write(json.dumps(rows[i]["payload"], ensure_ascii=False) + "\n")
+        (out_dir / "meta.json").write_text(
+            json.dumps({"count": len(keep), "dim": build["dim"], "dtype": self.dtype.name}), encoding="utf-8"
+        )
+
+        old_dir = self.path.with_name(self.path.name + ".old")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.path.exists():
+            self.path.rename(old_dir)
+        out_dir.rename(self.path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        shutil.rmtree(self.build_path, ignore_errors=True)
+        self.load()
+
+
+def create_vector_store(collection_name: str = "mango_kb", kind: str = None) -> VectorStore:
+    """
+    Build the configured backend.
+
+    Env:
+        VECTOR_STORE: qdrant (default) | qdrant-local | numpy
+        QDRANT_URL / QDRANT_API_KEY: remote Qdrant
+        QDRANT_PREFER_GRPC / QDRANT_GRPC_PORT: search over gRPC instead of REST
+        QDRANT_POOL_SIZE / QDRANT_TIMEOUT: async client connection pool and request timeout (s)
+        QDRANT_PATH: storage directory for qdrant-local
+        VECTOR_INDEX_PATH / VECTOR_INDEX_DTYPE: numpy index root (one directory per
+            collection below it) and float32|float16
+    """
+    kind = kind or os.getenv("VECTOR_STORE", "qdrant")
+    if kind == "qdrant":
+        return QdrantVectorStore(
+            collection_name,
+            url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+            api_key=os.getenv("QDRANT_API_KEY", None),
+            prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+            grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+            pool_size=int(os.getenv("QDRANT_POOL_SIZE", "10")),
+            timeout=int(os.getenv("QDRANT_TIMEOUT", "5")),
+        )
+    if kind == "qdrant-local":
+        return QdrantVectorStore(collection_name, path=os.getenv("QDRANT_PATH", str(DATA_DIR / "qdrant_local")))
+    if kind == "numpy":
+        return NumpyVectorStore(
+            Path(os.getenv("VECTOR_INDEX_PATH", str(DATA_DIR / "vector_index"))) / collection_name,
+            dtype=os.getenv("VECTOR_INDEX_DTYPE", "float32"),
+        )
+    raise ValueError(f"Unknown VECTOR_STORE '{kind}' (expected qdrant, qdrant-local or numpy)")
@@ -2,44 +2,239 @@
 WUT Orchestrator Module
 Handles classification and decision logic
 """
+import os
+import json
+import random
+from pathlib import Path
+from collections import OrderedDict
+import numpy as np
+from ..utils.matcher import KeywordMatcher
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def default_centroids_path(collection_name: str = "mango_kb") -> Path:
+    return DATA_DIR / "department_centroids" / f"{collection_name}.json"
+
 
 class WUTClassifier:
-    """Classifies incoming queries by department, intent, and urgency"""
-    
+    """
+    Classifies incoming queries by department, intent, and urgency.
+
+    Every keyword of every table sits in one compiled matcher, so a query is
+    scanned once whatever the vocabulary size. Within a field the first
+    label (in table order) with a keyword hit wins. Latin keywords match
+    whole words only ("hr" does not match "through").
+
+    Keyword tables:
+        wut_keywords.json: {"department"|"intent"|"urgency": {label: [keywords]}}
+        knowledge_base.json: each entry's `keywords` count for its `department`
+            in classify(), but not in scope(): they are retrieval keywords
+            ("approve", "เงิน"), not department vocabulary
+    """
+
+    DEFAULTS = {"department": "General", "intent": "question", "urgency": "low"}
+
+    def __init__(self, keywords_path: str = None, knowledge_base_path: str = None):
+        keywords_path = keywords_path or os.getenv("WUT_KEYWORDS_PATH") or DATA_DIR / "wut_keywords.json"
+        knowledge_base_path = knowledge_base_path or os.getenv("WUT_KNOWLEDGE_BASE_PATH") or DATA_DIR / "knowledge_base.json"
+
+        with open(keywords_path, "r", encoding="utf-8") as f:
+            tables = json.load(f)
+        self.priorities = {field: list(tables.get(field, {})) for field in self.DEFAULTS}
+        self.matcher = KeywordMatcher(word_boundaries=True)
+        for field, table in tables.items():
+            for label, keywords in table.items():
+                labels = [(field, label), ("scope", label)] if field == "department" else [(field, label)]
+                for keyword in keywords:
+                    self.matcher.add(keyword, labels)
+
+        if Path(knowledge_base_path).exists():
+            with open(knowledge_base_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries:
+                department = entry.get("department")
+                if not department:
+                    continue
+                if department not in self.priorities["department"]:
+                    self.priorities["department"].append(department)
+                for keyword in entry.get("keywords", []):
+                    self.matcher.add(keyword, [("department", department)])
+
     def classify(self, text: str):
         """Keyword-based classification for departments, intent, and urgency"""
-        text_lower = text.lower()
-        
-        # Department classification
-        department = "General"
-        if any(word in text_lower for word in ["password", "login", "network", "computer", "laptop", "software", "printer"]):
-            department = "IT"
-        elif any(word in text_lower for word in ["leave", "ลา", "sick", "vacation", "พักร้อน", "holiday", "hr", "payroll", "salary", "เงินเดือน"]):
-            department = "HR"
-        elif any(word in text_lower for word in ["invoice", "payment", "accounting", "บัญชี", "receipt", "tax"]):
-            department = "Accounting"
-        
-        # Intent classification
-        intent = "question"
-        if any(word in text_lower for word in ["request", "need", "want", "ขอ", "create", "ticket"]):
-            intent = "action_request"
-        elif any(word in text_lower for word in ["?", "how", "what", "when", "where", "why", "อย่างไร", "ทำไม"]):
-            intent = "question"
-        elif any(word in text_lower for word in ["problem", "issue", "error", "not working", "broken", "ปัญหา", "เสีย"]):
-            intent = "problem_report"
-        
-        # Urgency classification
-        urgency = "low"
-        if any(word in text_lower for word in ["urgent", "emergency", "critical", "asap", "immediately", "ด่วน"]):
-            urgency = "high"
-        elif any(word in text_lower for word in ["soon", "quickly", "priority"]):
-            urgency = "medium"
-        
+        return self._result(self.matcher.labels(text))
+
+    def classify_scoped(self, text: str):
+        """
+        classify() plus "scope": the department when the text names exactly
+        one, through the curated department table, else None. Only a scope is
+        confident enough to restrict retrieval to that department.
+        """
+        hits = self.matcher.labels(text)
+        result = self._result(hits)
+        departments = {label for field, label in hits if field == "department"}
+        scoped = {label for field, label in hits if field == "scope"}
+        result["scope"] = next(iter(scoped)) if len(scoped) == 1 and departments == scoped else None
+        return result
+
+    def _result(self, hits: dict) -> dict:
+        result = {}
+        for field, default in self.DEFAULTS.items():
+            result[field] = next(
+                (label for label in self.priorities[field] if (field, label) in hits), default
+            )
+        return result
+
+    def classify_batch(self, texts, memo_size: int = 4096):
+        """
+        classify() for many texts (ticket backfills), yielded in input order.
+
+        Texts are streamed, so millions of historical messages can be fed
+        from a cursor; the last memo_size distinct texts are remembered to
+        skip re-scanning repeats.
+        """
+        memo = OrderedDict()
+        for text in texts:
+            result = memo.get(text)
+            if result is None:
+                result = memo[text] = self.classify(text)
+                if len(memo) > memo_size:
+                    memo.popitem(last=False)
+            else:
+                memo.move_to_end(text)
+            yield dict(result)
+
+
+class EmbeddingClassifier:
+    """
+    Department from the query embedding: cosine similarity to per-department
+    centroids (mean of the department's chunk vectors, computed at ingestion),
+    turned into probabilities by a softmax whose temperature was fitted on
+    held-out chunks (temperature scaling, leave-one-out).
+
+    Classifying reuses the query vector retrieval already computed, so it
+    costs one (departments x dim) matrix-vector product.
+    """
+
+    def __init__(self, departments: list, centroids, temperature: float = 0.05, counts: dict = None):
+        self.departments = list(departments)
+        centroids = np.asarray(centroids, dtype=np.float32)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+        self.temperature = temperature
+        self.counts = counts or {}
+
+    @classmethod
+    def fit(cls, points, sample_size: int = 5000, min_count: int = 5, seed: int = 0) -> "EmbeddingClassifier":
+        """
+        Args:
+            points: iterable of (vector, department); streamed once, so a whole
+                collection can be passed without loading it into memory
+            sample_size: chunks kept (reservoir sample) to fit the temperature
+            min_count: departments with fewer chunks (at least 2) get no
+                centroid; `counts` still reports them
+        """
+        rng = random.Random(seed)
+        sums, counts, sample = {}, {}, []
+        seen = 0
+        for vector, department in points:
+            if not department:
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+            sums[department] = sums.get(department, 0) + vector
+            counts[department] = counts.get(department, 0) + 1
+            seen += 1
+            if len(sample) < sample_size:
+                sample.append((vector, department))
+            else:
+                j = rng.randrange(seen)
+                if j < sample_size:
+                    sample[j] = (vector, department)
+
+        departments = sorted(d for d in sums if counts[d] >= max(min_count, 2))
+        if len(departments) < 2:
+            raise ValueError(
+                f"At least two departments with {max(min_count, 2)}+ labelled chunks are needed "
+                f"to calibrate department centroids (have {counts})"
+            )
+        classifier = cls(departments, [sums[d] for d in departments], counts=counts)
+        sample = [(v, d) for v, d in sample if d in departments]
+        vectors = np.stack([v for v, _ in sample])
+        labels = np.asarray([departments.index(d) for _, d in sample])
+        sums = np.stack([sums[d] for d in departments])
+        classifier.temperature = classifier._fit_temperature(vectors, labels, sums)
+        return classifier
+
+    def _fit_temperature(self, vectors, labels, sums) -> float:
+        """
+        Temperature with the lowest negative log-likelihood of the true
+        departments, each chunk scored against its own department's centroid
+        computed without it. In-sample similarities are optimistic (a small
+        department's chunks nearly are its centroid), which drives the
+        temperature down and every confidence towards 1.
+        """
+        rows = np.arange(len(labels))
+        sims = vectors @ self.centroids.T
+        # Unit-length chunk v of a department with vector sum s: cos(v, s - v)
+        own = np.einsum("ij,ij->i", vectors, sums[labels])
+        rest_norm = np.sqrt(np.maximum(np.einsum("ij,ij->i", sums[labels], sums[labels]) - 2 * own + 1, 0))
+        sims[rows, labels] = (own - 1) / np.maximum(rest_norm, 1e-6)
+        best, best_nll = self.temperature, None
+        for temperature in np.geomspace(0.005, 1.0, 60):
+            log_probs = self._log_softmax(sims / temperature)
+            nll = -float(np.mean(log_probs[rows, labels]))
+            if best_nll is None or nll < best_nll:
+                best, best_nll = float(temperature), nll
+        return best
+
+    @staticmethod
+    def _log_softmax(logits):
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        return logits - np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+
+    def probabilities(self, vectors):
+        """(n, departments) calibrated probabilities for a batch of vectors"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        sims = (vectors / np.where(norms == 0, 1, norms)) @ self.centroids.T
+        return np.exp(self._log_softmax(sims / self.temperature))
+
+    def classify(self, vector) -> dict:
+        """{"department", "confidence": its probability, "probabilities": {department: p}}"""
+        probs = self.probabilities(vector)[0]
+        best = int(np.argmax(probs))
         return {
-            "department": department,
-            "intent": intent,
-            "urgency": urgency
+            "department": self.departments[best],
+            "confidence": float(probs[best]),
+            "probabilities": {d: float(p) for d, p in zip(self.departments, probs)},
         }
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "departments": self.departments,
+            "centroids": self.centroids.tolist(),
+            "temperature": self.temperature,
+            "counts": self.counts,
+        }), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """Saved classifier, or None when ingestion has not written one yet"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(data["departments"], data["centroids"], data["temperature"], data.get("counts"))
+
+
 class DecisionEngine:
     """Business rules engine for determining actions"""
     
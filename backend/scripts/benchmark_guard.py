@@ -0,0 +1,71 @@
+"""
+Layer 0 guard benchmark
+Per-request scan cost with a growing number of patterns; it should stay flat.
+
+Usage:
+    python scripts/benchmark_guard.py [--requests 2000]
+"""
+import re
+import sys
+import time
+import random
+import string
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.way_rag.guard import Guard, create_guard
+
+MESSAGES = [
+    "How do I reset my password for the VPN?",
+    "ลืมรหัสผ่านอีเมล ต้องทำอย่างไรครับ",
+    "ขอวิธีเบิกค่าเดินทาง MAT-001 และ PO SO ที่เกี่ยวข้อง",
+    "My laptop cannot connect to the office wifi since this morning, please help",
+]
+
+
+def random_phrases(n: int, rng: random.Random) -> list:
+    return [" ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8)))
+                     for _ in range(rng.randint(1, 3))) for _ in range(n)]
+
+
+def benchmark(guard: Guard, conversations: list) -> float:
+    """Microseconds per conversation for check_batch"""
+    guard.matcher.first("")  # Compile outside the timing
+    start = time.perf_counter()
+    guard.check_batch(conversations)
+    return (time.perf_counter() - start) / len(conversations) * 1e6
+
+
+def benchmark_naive(phrases: list, conversations: list) -> float:
+    """The old approach: one re.search per pattern and message"""
+    start = time.perf_counter()
+    for messages in conversations:
+        any(re.search(p, m["content"], re.IGNORECASE) for m in messages for p in phrases)
+    return (time.perf_counter() - start) / len(conversations) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Layer 0 guard")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    conversations = [
+        [{"role": "user", "content": rng.choice(MESSAGES)} for _ in range(rng.randint(1, 6))]
+        for _ in range(args.requests)
+    ]
+    extra = random_phrases(10000, rng)
+
+    print(f"🛡️ Guard benchmark: {args.requests} conversations")
+    print(f"   {'patterns':>8} {'guard':>12} {'re.search loop':>16}")
+    default = create_guard()
+    sizes = [(len(default.matcher), default)] + [(n, Guard(extra[:n])) for n in (100, 1000, 10000)]
+    for n, guard in sizes:
+        naive = benchmark_naive(extra[:n], conversations[:200]) if n <= 1000 else float("nan")
+        print(f"   {n:>8} {benchmark(guard, conversations):9.1f} µs {naive:13.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 import os
+import re
 import sys
+import json
+import uuid
+import hashlib
+import argparse
+import time
+import random
+import queue
+import threading
 import tempfile
 import glob
-import shutil
+import fnmatch
 from pathlib import Path
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from git import Repo
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import PointStruct
 from fastembed import TextEmbedding  # <--- NEW: Local Embedding
 
 # Setup
@@ -16,70 +27,717 @@ backend_dir = current_dir.parent
 sys.path.append(str(backend_dir))
 load_dotenv(backend_dir / ".env")
 
+from app.way_rag.chunking import chunk_markdown
+from app.way_rag.vector_store import create_vector_store
+from app.way_rag.lexical import BM25Index, TokenizerMismatchError, default_index_path
+from app.way_rag.digest import create_summarizer
+from app.wut_orchestrator import EmbeddingClassifier, default_centroids_path
+
 # Config
 REPO_URL = "https://github.com/waytid-way/mango-erp-reference-data.git"
 COLLECTION_NAME = "mango_kb"
+FAQ_COLLECTION_NAME = os.getenv("FAQ_COLLECTION", "mango_faq")  # FAQ questions for direct answers
 VECTOR_SIZE = 384  # <--- NEW: Size for bge-small-en-v1.5
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+# fastembed data-parallel workers: 0 = one per core, 1 = in-process
+EMBED_PARALLEL = int(os.getenv("INGEST_EMBED_PARALLEL", "0"))
+UPLOAD_BATCH_SIZE = int(os.getenv("INGEST_UPLOAD_BATCH_SIZE", "128"))
+UPLOAD_WORKERS = int(os.getenv("INGEST_UPLOAD_WORKERS", "4"))
+UPLOAD_RETRIES = int(os.getenv("INGEST_UPLOAD_RETRIES", "5"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "512"))  # chunks buffered between read and embed
+STATE_FILE = Path(os.getenv("INGEST_STATE_FILE", backend_dir / ".ingest_state.json"))
+CHECKPOINT_FILE = Path(os.getenv("INGEST_CHECKPOINT_FILE", backend_dir / ".ingest_checkpoint.jsonl"))
+LEXICAL_INDEX_PATH = Path(os.getenv("LEXICAL_INDEX_PATH", default_index_path(COLLECTION_NAME)))
+CENTROIDS_PATH = Path(os.getenv("DEPARTMENT_CENTROIDS_PATH", default_centroids_path(COLLECTION_NAME)))
+# Departments with fewer labelled chunks get no centroid (too few to calibrate on)
+CENTROID_MIN_CHUNKS = int(os.getenv("DEPARTMENT_CENTROID_MIN_CHUNKS", "5"))
+# Curated department of markdown sources: {"paths": {glob: department}, "modules": {code: department}}
+DEPARTMENT_SCOPES_PATH = Path(os.getenv(
+    "DEPARTMENT_SCOPES_PATH", backend_dir / "app" / "data" / "department_scopes.json"
+))
+DIGEST_CACHE_FILE = Path(os.getenv("INGEST_DIGEST_CACHE_FILE", backend_dir / ".ingest_digests.json"))
+
+# Curated sources shipped with this repo, ingested next to the reference data
+LOCAL_PREFIX = "local/"
+LOCAL_SOURCES = {
+    "local/knowledge_base.json": backend_dir / "app" / "data" / "knowledge_base.json",
+    "local/KNOWLEDGE_BASE.md": backend_dir.parent / "KNOWLEDGE_BASE.md",
+}
+
+# Vector store (VECTOR_STORE=qdrant | qdrant-local | numpy, overridable with --store)
+STORE_KIND = os.getenv("VECTOR_STORE", "qdrant")
+store = None
+faq_store = None
+
+def open_store(kind: str):
+    global store, faq_store, STORE_KIND
+    STORE_KIND = kind
+    store = create_vector_store(COLLECTION_NAME, kind)
+    faq_store = create_vector_store(FAQ_COLLECTION_NAME, kind)
+    print(f"🔌 Vector store: {kind} ({type(store).__name__})")
+    return store
+
+# Optional chunk digests (INGEST_DIGEST=none | local | groq, overridable with --digest)
+summarizer = create_summarizer()
+digest_cache = {}   # hash(summarizer, chunk text) -> digest, persisted across runs
+digest_used = set()
 
-# Clients
-qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
-qdrant_key = os.getenv("QDRANT_API_KEY", None)
-print(f"🔌 Connecting to Qdrant: {qdrant_url}")
-qdrant = QdrantClient(url=qdrant_url, api_key=qdrant_key)
+# Local Embedding Model (loaded on first use)
+embedding_model = None
 
-# Initialize Local Embedding Model
-print("🧠 Loading Local Embedding Model (BAAI/bge-small-en-v1.5)...")
-embedding_model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
+def get_model():
+    global embedding_model
+    if embedding_model is None:
+        print("🧠 Loading Local Embedding Model (BAAI/bge-small-en-v1.5)...")
+        embedding_model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
+    return embedding_model
 
-def get_embedding(text):
-    # FastEmbed returns a generator, convert to list
-    return list(embedding_model.embed([text]))[0]
+def embed_texts(texts):
+    """
+    Yield one vector per text, in order. texts may be a lazy iterable.
+
+    fastembed splits the input into EMBED_BATCH_SIZE batches and, with
+    EMBED_PARALLEL != 1, fans them out to worker processes that each load the
+    model once. The first two batches are read ahead: runs with less work than
+    that stay in-process to skip pool start-up, however many documents the
+    chunks came from.
+    """
+    texts = iter(texts)
+    head = list(islice(texts, EMBED_BATCH_SIZE * 2))
+    parallel = None if EMBED_PARALLEL == 1 or len(head) < EMBED_BATCH_SIZE * 2 else EMBED_PARALLEL
+    yield from get_model().embed(chain(head, texts), batch_size=EMBED_BATCH_SIZE, parallel=parallel)
 
 def process_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def run_ingestion():
-    print("🚀 Starting Hybrid Ingestion (Local Embed + Cloud Storage)...")
-    
-    # 1. Recreate Collection (CRITICAL: Size changed from 1536 to 384)
-    qdrant.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+# ==========================================
+# Incremental ingestion helpers
+# ==========================================
+
+def point_id(rel_path: str, chunk_index: int | None = None) -> str:
+    """Stable point ID derived from the file path (survives re-ordering and other files' renames)"""
+    key = f"{REPO_URL}#{rel_path}" if chunk_index is None else f"{REPO_URL}#{rel_path}#{chunk_index}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def load_digest_cache():
+    global digest_cache
+    digest_cache = {}
+    if summarizer is not None and DIGEST_CACHE_FILE.exists():
+        digest_cache = json.loads(DIGEST_CACHE_FILE.read_text(encoding="utf-8"))
+
+def save_digest_cache(prune: bool = False):
+    """Persist digests; a full rebuild drops those of chunks that no longer exist"""
+    if summarizer is None:
+        return
+    kept = {k: v for k, v in digest_cache.items() if k in digest_used} if prune else digest_cache
+    DIGEST_CACHE_FILE.write_text(json.dumps(kept, ensure_ascii=False), encoding="utf-8")
+
+def add_digests(records: list):
+    """Attach payload["digest"] to each record, summarizing only chunk texts not seen before"""
+    keys = [content_hash(f"{summarizer.name}:{text}") for text, _ in records]
+    missing = {}
+    for key, (text, _) in zip(keys, records):
+        if key not in digest_cache:
+            missing[key] = text
+    if missing:
+        for key, digest in zip(missing, summarizer.summarize(list(missing.values()))):
+            if digest:
+                digest_cache[key] = digest
+    for key, (_, payload) in zip(keys, records):
+        digest_used.add(key)
+        if key in digest_cache:
+            payload["digest"] = digest_cache[key]
+
+def load_state() -> dict:
+    if STATE_FILE.exists():
+        return json.loads(STATE_FILE.read_text(encoding="utf-8"))
+    return {}
+
+def save_state(commit_sha: str, local_hashes: dict | None = None):
+    STATE_FILE.write_text(
+        json.dumps({
+            "repo": REPO_URL, "collection": COLLECTION_NAME, "store": STORE_KIND,
+            "commit": commit_sha, "local_sources": local_hashes or {},
+        }, indent=2),
+        encoding="utf-8",
     )
-    print(f"✅ Collection reset with vector size {VECTOR_SIZE}")
 
-    # 2. Ephemeral Clone
-    with tempfile.TemporaryDirectory() as temp_dir:
-        print(f"⬇️ Cloning repo...")
-        Repo.clone_from(REPO_URL, temp_dir)
-        
-        files = glob.glob(os.path.join(temp_dir, "**/*.md"), recursive=True)
-        print(f"📦 Found {len(files)} docs.")
-        
-        points = []
-        for idx, file_path in enumerate(files):
+def clone_markdown_only(dest: str) -> Repo:
+    """
+    Partial clone (commits and trees only) with a sparse checkout of *.md,
+    so non-markdown blobs are never downloaded.
+    """
+    repo = Repo.clone_from(REPO_URL, dest, multi_options=["--filter=blob:none", "--no-checkout"])
+    repo.git.sparse_checkout("set", "--no-cone", "*.md")
+    repo.git.checkout()
+    return repo
+
+def diff_markdown(repo: Repo, old_sha: str, new_sha: str):
+    """
+    List markdown files changed between two commits.
+
+    Renames are reported as delete + add because point IDs are path based.
+
+    Returns:
+        (changed, removed): repo-relative paths to re-embed / to delete
+    """
+    output = repo.git.diff("--name-status", "--no-renames", old_sha, new_sha, "--", "*.md")
+    changed, removed = [], []
+    for line in output.splitlines():
+        status, rel_path = line.split("\t", 1)
+        if status == "D":
+            removed.append(rel_path)
+        else:
+            changed.append(rel_path)
+    return changed, removed
+
+def has_commit(repo: Repo, sha: str) -> bool:
+    try:
+        repo.commit(sha)
+        return True
+    except Exception:
+        return False
+
+def collection_exists() -> bool:
+    return store.exists()
+
+def delete_files(rel_paths: list):
+    """Delete every point that belongs to the given files"""
+    if not rel_paths:
+        return
+    store.delete_paths(rel_paths)
+    print(f"🗑️ Removed points for {len(rel_paths)} files")
+
+def local_sources() -> list:
+    """Repo-local sources that exist in this checkout"""
+    return [rel_path for rel_path, path in LOCAL_SOURCES.items() if path.exists()]
+
+def local_source_hashes() -> dict:
+    """{rel_path: content hash} of the repo-local sources, stored in the ingest state"""
+    return {rel_path: content_hash(process_file(LOCAL_SOURCES[rel_path])) for rel_path in local_sources()}
+
+def diff_local_sources(state: dict, local_hashes: dict):
+    """
+    Local sources are not in the reference repo's history, so they are
+    compared with the hashes of the last ingested run instead.
+
+    Returns:
+        (changed, removed) like diff_markdown
+    """
+    previous = state.get("local_sources", {})
+    changed = [p for p, h in local_hashes.items() if previous.get(p) != h]
+    removed = [p for p in previous if p not in local_hashes]
+    return changed, removed
+
+def kb_entry_records(rel_path: str, content: str) -> list:
+    """One record per knowledge_base.json entry, keeping its curated keywords"""
+    entries = json.loads(content)
+    doc_hash = content_hash(content)
+    records = []
+    for idx, entry in enumerate(entries):
+        text = f"{entry['title']}\n\n{entry['content']}"
+        records.append((text, {
+            "title": entry["title"],
+            "path": rel_path,
+            "content": text,
+            "section": entry["title"],
+            "kind": "entry",
+            "chunk_index": idx,
+            "chunk_count": len(entries),
+            "parent_id": point_id(rel_path),
+            "content_hash": doc_hash,
+            "entry_id": entry.get("id"),
+            "department": entry.get("department"),
+            "keywords": entry.get("keywords", []),
+        }))
+    return records
+
+# Department / module payload fields for scoped searches (indexed in Qdrant)
+MODULE_CODE = re.compile(r"\(([A-Z]{2,5})\)")
+department_scopes = None
+
+def load_department_scopes() -> dict:
+    global department_scopes
+    if department_scopes is None:
+        department_scopes = {"paths": {}, "modules": {}}
+        if DEPARTMENT_SCOPES_PATH.exists():
+            department_scopes.update(json.loads(DEPARTMENT_SCOPES_PATH.read_text(encoding="utf-8")))
+    return department_scopes
+
+def scope_fields(rel_path: str, section: str) -> dict:
+    """
+    Module from a "Name (CODE)" heading; department only where it is curated
+    (DEPARTMENT_SCOPES_PATH by path or module). Chunks without one are never
+    inside a department-filtered search, so guessing would hide them.
+    """
+    scopes = load_department_scopes()
+    fields = {}
+    for heading in reversed(section.split(" > ")):
+        match = MODULE_CODE.search(heading)
+        if match:
+            fields["module"] = match.group(1)
+            break
+    department = next((d for pattern, d in scopes["paths"].items() if fnmatch.fnmatch(rel_path, pattern)), None)
+    department = department or scopes["modules"].get(fields.get("module"))
+    if department:
+        fields["department"] = department
+    return fields
+
+def markdown_records(rel_path: str, content: str) -> list:
+    """Chunk a markdown file on headings / FAQ pairs"""
+    filename = os.path.basename(rel_path)
+    chunks = chunk_markdown(content, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+    doc_hash = content_hash(content)
+
+    records = []
+    for idx, chunk in enumerate(chunks):
+        payload = {
+            "title": filename,
+            "path": rel_path,
+            "content": chunk["text"],
+            "section": chunk["section"],
+            "kind": chunk["kind"],
+            "chunk_index": idx,
+            "chunk_count": len(chunks),
+            "parent_id": point_id(rel_path),
+            "content_hash": doc_hash,
+            **scope_fields(rel_path, chunk["section"]),
+        }
+        if chunk["kind"] == "faq":
+            payload["question"] = chunk["question"]
+            payload["answer"] = chunk["answer"]
+        records.append((chunk["text"], payload))
+    return records
+
+def chunk_file(repo_dir: str, rel_path: str) -> list:
+    """Chunk one file on headings / FAQ pairs into (text, payload) records"""
+    if rel_path.startswith(LOCAL_PREFIX):
+        content = process_file(LOCAL_SOURCES[rel_path])
+    else:
+        content = process_file(os.path.join(repo_dir, rel_path))
+    if not content.strip():
+        return []
+    if rel_path.endswith(".json"):
+        records = kb_entry_records(rel_path, content)
+    else:
+        records = markdown_records(rel_path, content)
+    # Digests are cached by chunk text, so the lexical pass re-uses them for free
+    if summarizer is not None:
+        add_digests(records)
+    return records
+
+# ==========================================
+# Streaming pipeline: read -> chunk -> embed -> upload
+# ==========================================
+
+_END = object()
+
+class Checkpoint:
+    """
+    Append-only JSONL record of files fully uploaded for one target commit.
+
+    The first line is a header {"commit", "mode"}; every further line is
+    {"path"}. A checkpoint for another commit or mode is discarded.
+    """
+
+    def __init__(self, path: Path, commit: str, mode: str):
+        self.path = path
+        self.header = {"commit": commit, "mode": mode}
+        self.done = set()
+        self._lock = threading.Lock()
+
+        if path.exists():
+            lines = path.read_text(encoding="utf-8").splitlines()
+            if lines and json.loads(lines[0]) == self.header:
+                for line in lines[1:]:
+                    try:
+                        self.done.add(json.loads(line)["path"])
+                    except (ValueError, KeyError):
+                        pass  # Torn last line from an interrupted write
+        self.resuming = bool(self.done)
+        if not self.resuming:
+            path.write_text(json.dumps(self.header) + "\n", encoding="utf-8")
+
+    def mark_done(self, rel_path: str):
+        with self._lock:
+            self.done.add(rel_path)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"path": rel_path}, ensure_ascii=False) + "\n")
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+def upsert_with_retry(points: list, attempts: int = None, base_delay: float = 0.5):
+    """Upsert one batch, retrying with exponential backoff and jitter"""
+    attempts = attempts or UPLOAD_RETRIES
+    for attempt in range(1, attempts + 1):
+        try:
+            store.upsert(points)
+            return
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = base_delay * 2 ** (attempt - 1) * (1 + random.random() * 0.25)
+            print(f"⚠️ Upload of {len(points)} points failed ({e}); retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+class Uploader:
+    """Parallel batch uploader with a bounded number of batches in flight"""
+
+    def __init__(self, checkpoint: Checkpoint, workers: int, max_in_flight: int):
+        self.checkpoint = checkpoint
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.remaining = {}  # path -> chunks not yet uploaded
+        self.uploaded_chunks = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def expect(self, rel_path: str, chunk_count: int):
+        with self._lock:
+            self.remaining.setdefault(rel_path, chunk_count)
+
+    def submit(self, points: list):
+        if self.error:
+            raise self.error
+        self.slots.acquire()  # Back-pressure: blocks the embed stage when uploads lag
+        future = self.executor.submit(upsert_with_retry, points)
+        future.add_done_callback(lambda f: self._on_done(f, points))
+
+    def _on_done(self, future, points):
+        try:
+            if future.exception():
+                self.error = self.error or future.exception()
+                return
+            finished = []
+            with self._lock:
+                self.uploaded_chunks += len(points)
+                for point in points:
+                    rel_path = point.payload["path"]
+                    self.remaining[rel_path] -= 1
+                    if self.remaining[rel_path] == 0:
+                        del self.remaining[rel_path]
+                        finished.append(rel_path)
+            for rel_path in finished:
+                self.checkpoint.mark_done(rel_path)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.error:
+            raise self.error
+
+def put_until_stopped(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once stop is set (the consumer is gone)"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def read_stage(repo_dir: str, rel_paths: list, out: queue.Queue, checkpoint: Checkpoint,
+               stop: threading.Event):
+    """Producer thread: read and chunk files one at a time into a bounded queue"""
+    try:
+        for rel_path in rel_paths:
+            if stop.is_set():
+                return
             try:
-                content = process_file(file_path)
-                filename = os.path.basename(file_path)
-                if not content.strip(): continue
-
-                print(f"   🔹 Embedding: {filename}")
-                vector = get_embedding(content[:2000]) # Limit context window
-                
-                points.append(PointStruct(
-                    id=idx,
-                    vector=vector,
-                    payload={"title": filename, "content": content}
-                ))
+                records = chunk_file(repo_dir, rel_path)
             except Exception as e:
-                print(f"⚠️ Error {filename}: {e}")
+                print(f"⚠️ Error {os.path.basename(rel_path)}: {e}")
+                continue
+            if not records:
+                checkpoint.mark_done(rel_path)
+            for record in records:
+                # Blocks while the embed stage is behind
+                if not put_until_stopped(out, record, stop):
+                    return
+    finally:
+        put_until_stopped(out, _END, stop)
+
+def run_pipeline(repo_dir: str, rel_paths: list, checkpoint: Checkpoint) -> int:
+    """
+    Stream files through read -> chunk -> embed -> upload.
+
+    Memory is bounded by QUEUE_SIZE chunks, the embedder's in-flight batches
+    and UPLOAD_WORKERS * 2 upload batches, regardless of corpus size.
+
+    Returns:
+        number of chunks uploaded
+    """
+    todo = [p for p in rel_paths if p not in checkpoint.done]
+    if len(todo) < len(rel_paths):
+        print(f"⏩ Resuming: {len(rel_paths) - len(todo)} docs already uploaded")
+
+    chunk_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=read_stage, args=(repo_dir, todo, chunk_queue, checkpoint, stop), daemon=True,
+    )
+    reader.start()
+
+    uploader = Uploader(checkpoint, workers=UPLOAD_WORKERS, max_in_flight=UPLOAD_WORKERS * 2)
+    payloads = deque()  # Payloads of texts handed to the embedder, in order
+
+    def texts():
+        while True:
+            item = chunk_queue.get()
+            if item is _END:
+                return
+            text, payload = item
+            uploader.expect(payload["path"], payload["chunk_count"])
+            payloads.append(payload)
+            yield text
+
+    print(f"   🔹 Streaming {len(todo)} docs (embed batch={EMBED_BATCH_SIZE}, "
+          f"parallel={EMBED_PARALLEL or 'all cores'}, upload batch={UPLOAD_BATCH_SIZE} x {UPLOAD_WORKERS})")
+    start = time.perf_counter()
+    embedded = 0
+    batch = []
+    try:
+        for vector in embed_texts(texts()):
+            payload = payloads.popleft()
+            batch.append(PointStruct(
+                id=point_id(payload["path"], payload["chunk_index"]),
+                vector=vector,
+                payload=payload,
+            ))
+            embedded += 1
+            if len(batch) >= UPLOAD_BATCH_SIZE:
+                uploader.submit(batch)
+                batch = []
+            if embedded % EMBED_BATCH_SIZE == 0:
+                elapsed = max(time.perf_counter() - start, 1e-9)
+                docs = len(checkpoint.done) - (len(rel_paths) - len(todo))
+                print(f"   ⏱️ {embedded} chunks embedded, {docs}/{len(todo)} docs uploaded "
+                      f"({docs / elapsed:.1f} docs/s, {embedded / elapsed:.1f} chunks/s)")
+        if batch:
+            uploader.submit(batch)
+    finally:
+        # Embed failure or Ctrl-C: the reader may be blocked on a full queue
+        stop.set()
+        reader.join()
+        uploader.close()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"   ⏱️ {len(todo)} docs / {uploader.uploaded_chunks} chunks in {elapsed:.1f}s "
+          f"({len(todo) / elapsed:.1f} docs/s)")
+    return uploader.uploaded_chunks
+
+def update_lexical_index(repo_dir: str, changed: list, removed: list, rebuild: bool):
+    """
+    Refresh the BM25 index next to the vector store.
+
+    Re-chunking is cheap (no embedding), so this runs as its own pass after
+    the pipeline and is unaffected by checkpoint resumes.
+    """
+    index = BM25Index()
+    if not rebuild:
+        try:
+            index = BM25Index.load(LEXICAL_INDEX_PATH)
+        except TokenizerMismatchError as e:
+            print(f"⚠️ {e}; rebuilding the lexical index from every source")
+            changed = all_sources(repo_dir)
+    index.remove_paths(changed + removed)
+    for rel_path in changed:
+        try:
+            records = chunk_file(repo_dir, rel_path)
+        except Exception as e:
+            print(f"⚠️ Lexical index skipped {rel_path}: {e}")
+            continue
+        for text, payload in records:
+            index.add(point_id(rel_path, payload["chunk_index"]), text, payload, payload.get("keywords", ()))
+    index.save(LEXICAL_INDEX_PATH)
+    print(f"🔤 Lexical index: {len(index)} chunks -> {LEXICAL_INDEX_PATH.name}")
+
+def all_sources(repo_dir: str) -> list:
+    """Every markdown file of the checkout plus the repo-local sources"""
+    files = glob.glob(os.path.join(repo_dir, "**/*.md"), recursive=True)
+    return [os.path.relpath(f, repo_dir) for f in files] + local_sources()
+
+def update_faq_index(repo_dir: str, changed: list, removed: list, rebuild: bool):
+    """
+    Index FAQ questions on their own (question vector, answer in the payload)
+    for the engine's direct-answer path. Like the lexical index this is a
+    separate pass; it only embeds the (short) questions.
+    """
+    if rebuild or not faq_store.supports_incremental or not faq_store.exists():
+        faq_store.recreate(VECTOR_SIZE)
+        paths = all_sources(repo_dir)
+    else:
+        faq_store.delete_paths(changed + removed)
+        paths = changed
+
+    records = []
+    for rel_path in paths:
+        try:
+            chunks = chunk_file(repo_dir, rel_path)
+        except Exception as e:
+            print(f"⚠️ FAQ index skipped {rel_path}: {e}")
+            continue
+        for _, payload in chunks:
+            if payload["kind"] != "faq":
+                continue
+            records.append((payload["question"], {
+                "question": payload["question"],
+                "answer": payload["answer"],
+                "title": payload["title"],
+                "path": rel_path,
+                "section": payload["section"],
+                "department": payload.get("department"),
+                "module": payload.get("module"),
+                "chunk_index": payload["chunk_index"],
+            }))
+
+    vectors = embed_texts(question for question, _ in records)
+    points = [
+        PointStruct(id=point_id(payload["path"], payload["chunk_index"]), vector=list(vector), payload=payload)
+        for (_, payload), vector in zip(records, vectors)
+    ]
+    for start in range(0, len(points), UPLOAD_BATCH_SIZE):
+        faq_store.upsert(points[start:start + UPLOAD_BATCH_SIZE])
+    faq_store.finalize()
+    print(f"❓ FAQ index: {len(points)} questions -> {FAQ_COLLECTION_NAME}")
+
+def curated_departments() -> set:
+    """Departments assigned by curation: knowledge_base.json entries and DEPARTMENT_SCOPES_PATH"""
+    entries = json.loads(process_file(LOCAL_SOURCES["local/knowledge_base.json"]))
+    scopes = load_department_scopes()
+    return (
+        {entry["department"] for entry in entries if entry.get("department")}
+        | set(scopes["paths"].values()) | set(scopes["modules"].values())
+    )
+
+def update_department_centroids():
+    """
+    Per-department centroids of the stored chunk vectors plus a fitted softmax
+    temperature, for the engine's embedding classifier. Read back from the
+    store, so incremental runs see every chunk, not just the changed ones.
+
+    Only chunks with a curated department are used: the temperature is
+    calibrated against these labels, so a guessed label would make the
+    engine's confidence look better than it is.
+    """
+    departments = curated_departments()
+    points = (
+        (vector, payload["department"]) for vector, payload in store.iter_vectors()
+        if payload.get("department") in departments
+    )
+    try:
+        classifier = EmbeddingClassifier.fit(points, min_count=CENTROID_MIN_CHUNKS)
+    except ValueError as e:
+        # Stale centroids would keep routing on labels that no longer exist
+        CENTROIDS_PATH.unlink(missing_ok=True)
+        print(f"⚠️ Department centroids skipped: {e}")
+        return
+    classifier.save(CENTROIDS_PATH)
+    summary = ", ".join(f"{d} {classifier.counts[d]}" for d in classifier.departments)
+    print(f"🧭 Department centroids ({summary}), temperature {classifier.temperature:.3f}")
+    skipped = sorted(set(classifier.counts) - set(classifier.departments))
+    if skipped:
+        print(f"⚠️ No centroid for {', '.join(skipped)} (fewer than {CENTROID_MIN_CHUNKS} chunks)")
+
+def publish_index_version(head_sha: str) -> str:
+    """Bump the store's index-version marker so running engines drop cached retrievals"""
+    version = f"{head_sha[:12]}-{int(time.time())}"
+    store.set_index_version(version)
+    print(f"🏷️ Index version {version}")
+    return version
+
+def run_ingestion(full: bool = False):
+    print("🚀 Starting Hybrid Ingestion (Local Embed + Cloud Storage)...")
+    if store is None:
+        open_store(STORE_KIND)
+    state = load_state()
+    local_hashes = local_source_hashes()
+    load_digest_cache()
+
+    # 1. Sparse, blob-less clone (only *.md contents are fetched)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print(f"⬇️ Cloning repo (markdown only)...")
+        repo = clone_markdown_only(temp_dir)
+        head_sha = repo.head.commit.hexsha
+        last_sha = state.get("commit")
+
+        incremental = (
+            not full
+            and last_sha
+            and state.get("collection") == COLLECTION_NAME
+            and state.get("store", "qdrant") == STORE_KIND
+            and store.supports_incremental
+            and has_commit(repo, last_sha)
+            and collection_exists()
+        )
+
+        local_changed, local_removed = diff_local_sources(state, local_hashes)
+        if incremental and last_sha == head_sha and not local_changed and not local_removed:
+            print(f"✅ Already up to date at {head_sha[:8]}")
+            return
+
+        mode = "incremental" if incremental else "full"
+        checkpoint = Checkpoint(CHECKPOINT_FILE, head_sha, f"{STORE_KIND}:{mode}")
+
+        if incremental:
+            changed, removed = diff_markdown(repo, last_sha, head_sha)
+            print(f"🔁 Incremental {last_sha[:8]}..{head_sha[:8]}: {len(changed)} changed, {len(removed)} removed")
+            # Changed files are deleted first so stale points never linger
+            # (files finished by an interrupted run are kept)
+            changed += [p for p in local_changed if p not in changed]
+            removed += local_removed
+            if local_changed or local_removed:
+                print(f"🔁 Local sources: {len(local_changed)} changed, {len(local_removed)} removed")
+            delete_files([p for p in changed + removed if p not in checkpoint.done])
+            store.ensure_payload_indexes()
+        else:
+            if not checkpoint.resuming:
+                # 2. Recreate Collection (CRITICAL: Size changed from 1536 to 384)
+                store.recreate(VECTOR_SIZE)
+                print(f"✅ Collection reset with vector size {VECTOR_SIZE}")
+            changed = all_sources(temp_dir)
+            removed = []
 
-        # 3. Upload
-        if points:
-            print(f"⬆️ Uploading {len(points)} vectors...")
-            qdrant.upsert(collection_name=COLLECTION_NAME, points=points)
-            print("✅ Ingestion Complete! (No OpenAI Quota used)")
+        # 3. Stream chunks to the vector store
+        print(f"📦 {len(changed)} docs to chunk, embed and upload.")
+        try:
+            run_pipeline(temp_dir, changed, checkpoint)
+            store.finalize()
+            update_lexical_index(temp_dir, changed, removed, rebuild=not incremental)
+            update_faq_index(temp_dir, changed, removed, rebuild=not incremental)
+            update_department_centroids()
+            publish_index_version(head_sha)
+        except Exception:
+            save_digest_cache()
+            print(f"❌ Ingestion interrupted; progress saved to {CHECKPOINT_FILE.name}, re-run to resume")
+            raise
+        # The lexical pass re-chunked every changed file, so a full run saw all live chunks
+        save_digest_cache(prune=not incremental)
+        save_state(head_sha, local_hashes)
+        checkpoint.remove()
+        print(f"✅ Ingestion Complete at {head_sha[:8]}! (No OpenAI Quota used)")
 
 if __name__ == "__main__":
-    run_ingestion()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest mango-erp-reference-data into a vector store")
+    parser.add_argument("--full", action="store_true", help="Rebuild the collection instead of applying the git diff")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--parallel", type=int, default=EMBED_PARALLEL, help="Embedding worker processes (0 = all cores, 1 = in-process)")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS, help="Concurrent upload batches")
+    parser.add_argument("--store", choices=["qdrant", "qdrant-local", "numpy"], default=STORE_KIND, help="Vector store to export to")
+    parser.add_argument("--digest", choices=["none", "local", "groq"], default=None, help="Generate per-chunk digests for prompts (default: INGEST_DIGEST)")
+    args = parser.parse_args()
+    EMBED_BATCH_SIZE = args.batch_size
+    EMBED_PARALLEL = args.parallel
+    UPLOAD_WORKERS = args.upload_workers
+    if args.digest:
+        summarizer = create_summarizer(args.digest)
+    open_store(args.store)
+    run_ingestion(full=args.full)
@@ -0,0 +1,93 @@
+"""
+Context packer tests
+Token budget split, MMR de-duplication and greedy filling (no model or services needed)
+"""
+import numpy as np
+from app.way_rag.context import ContextPacker, truncate_to_tokens
+from app.way_rag.chunking import estimate_tokens
+from app.way_rag.vector_store import SearchHit
+
+
+def hit(id, content, vector=None, **payload):
+    return SearchHit(id, 1.0, {"content": content, **payload}, vector)
+
+
+def words(n, word="alpha"):
+    return " ".join(f"{word}{i}" for i in range(n))
+
+
+class TestTruncate:
+    def test_short_text_untouched(self):
+        assert truncate_to_tokens("hello world", 50) == "hello world"
+
+    def test_long_text_fits_budget(self):
+        text = truncate_to_tokens(words(200), 40)
+        assert estimate_tokens(text) <= 41
+        assert text.endswith("…")
+
+    def test_zero_budget(self):
+        assert truncate_to_tokens("hello", 0) == ""
+
+
+class TestContextPacker:
+    """Test budget allocation between history and chunks"""
+
+    def test_everything_fits(self):
+        packer = ContextPacker(budget_tokens=500)
+        history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        packed = packer.pack(history, [hit(1, "a b c"), hit(2, "d e f")])
+        assert packed["history"] == history
+        assert [h.id for h in packed["hits"]] == [1, 2]
+        assert packed["texts"] == ["a b c", "d e f"]
+
+    def test_budget_is_respected(self):
+        packer = ContextPacker(budget_tokens=300, history_share=0.3)
+        history = [{"role": "user", "content": words(150, "old")}, {"role": "user", "content": words(150, "new")}]
+        hits = [hit(i, words(60, f"c{i}x")) for i in range(6)]
+        packed = packer.pack(history, hits)
+        assert packed["history_tokens"] + packed["context_tokens"] <= 300
+        # The newest message is kept (truncated) before older ones
+        assert len(packed["history"]) == 1
+        assert packed["history"][0]["content"].startswith("new0")
+        assert len(packed["hits"]) == 2
+
+    def test_unused_chunk_budget_returns_to_history(self):
+        packer = ContextPacker(budget_tokens=400, history_share=0.2)
+        history = [{"role": "user", "content": words(100, "old")}, {"role": "user", "content": words(50, "new")}]
+        packed = packer.pack(history, [hit(1, "short chunk")])
+        assert len(packed["history"]) == 2
+
+    def test_greedy_skips_chunks_that_do_not_fit(self):
+        packer = ContextPacker(budget_tokens=100, history_share=0.0)
+        packed = packer.pack([], [hit(1, words(60, "a")), hit(2, words(60, "b")), hit(3, "tiny fact")])
+        assert [h.id for h in packed["hits"]] == [1, 3]
+
+    def test_first_chunk_truncated_rather_than_dropped(self):
+        packer = ContextPacker(budget_tokens=50, history_share=0.0)
+        packed = packer.pack([], [hit(1, words(200))])
+        assert [h.id for h in packed["hits"]] == [1]
+        assert packed["context_tokens"] <= 50
+
+    def test_digest_used_instead_of_content(self):
+        packed = ContextPacker().pack([], [hit(1, words(300), digest="the fact")])
+        assert packed["texts"] == ["the fact"]
+
+    def test_near_duplicate_vectors_dropped(self):
+        v = np.array([1.0, 0.0, 0.0])
+        hits = [hit(1, "one", v), hit(2, "two", v * 0.99 + [0, 0.01, 0]), hit(3, "three", np.array([0.0, 1.0, 0.0]))]
+        packed = ContextPacker().pack([], hits)
+        assert [h.id for h in packed["hits"]] == [1, 3]
+
+    def test_near_duplicate_text_without_vectors(self):
+        text = "Reset your password at portal.mango.co.th using OTP"
+        hits = [hit("a", text), hit("b", text + "."), hit("c", "Leave requests go to HR")]
+        packed = ContextPacker().pack([], hits)
+        assert [h.id for h in packed["hits"]] == ["a", "c"]
+
+    def test_mmr_prefers_diverse_chunk(self):
+        a = np.array([1.0, 0.0])
+        similar = np.array([0.85, 0.53])
+        diverse = np.array([0.0, 1.0])
+        hits = [hit(1, "one", a), hit(2, "two", similar), hit(3, "three", diverse)]
+        packed = ContextPacker(mmr_lambda=0.5).pack([], hits)
+        assert [h.id for h in packed["hits"]] == [1, 3, 2]
@@ -0,0 +1,98 @@
+"""
+Lexical retrieval tests
+Tokenizer, BM25 index and reciprocal-rank fusion (pure Python, no services needed)
+"""
+import pytest
+from app.way_rag.lexical import BM25Index, TokenizerMismatchError, tokenize, is_exact_term_query, reciprocal_rank_fusion
+from app.way_rag.vector_store import SearchHit
+
+
+class TestTokenize:
+    """Test mixed Thai/English tokenization"""
+
+    def test_codes_kept_whole_and_split(self):
+        tokens = tokenize("See MAT-001 for details")
+        assert "mat-001" in tokens
+        assert "mat" in tokens and "001" in tokens
+
+    def test_thai_text_produces_tokens(self):
+        tokens = tokenize("รีเซ็ตรหัสผ่าน")
+        assert tokens
+        assert all(token.strip() for token in tokens)
+
+    def test_zero_width_ignored(self):
+        assert tokenize("pass\u200bword") == tokenize("password")
+
+
+class TestExactTermQuery:
+    """Test detection of code-only queries"""
+
+    @pytest.mark.parametrize("query", ["BD", "MAT-001", "PO SO", "MAT-001?"])
+    def test_codes(self, query):
+        assert is_exact_term_query(query)
+
+    @pytest.mark.parametrize("query", ["", "how do I reset my password", "bd", "วิธีลา"])
+    def test_natural_language(self, query):
+        assert not is_exact_term_query(query)
+
+
+class TestBM25Index:
+    """Test ranking, keyword boost and persistence"""
+
+    @pytest.fixture
+    def index(self):
+        index = BM25Index()
+        index.add("a", "Password Reset Procedure via portal", {"path": "local/kb.json"}, keywords=["password"])
+        index.add("b", "Leave request policy, password not needed", {"path": "docs/hr.md", "department": "HR"})
+        index.add("c", "BD business development overview", {"path": "docs/bd.md"})
+        return index
+
+    def test_keyword_boost_ranks_first(self, index):
+        hits = index.search("password")
+        assert hits[0].id == "a"
+        assert {hit.id for hit in hits} == {"a", "b"}
+
+    def test_exact_code(self, index):
+        assert [hit.id for hit in index.search("BD")] == ["c"]
+
+    def test_no_match(self, index):
+        assert index.search("xyzzy") == []
+
+    def test_filters(self, index):
+        assert [hit.id for hit in index.search("password", filters={"department": "HR"})] == ["b"]
+        assert index.search("password", filters={"department": "IT"}) == []
+
+    def test_remove_paths(self, index):
+        index.remove_paths(["local/kb.json"])
+        assert [hit.id for hit in index.search("password")] == ["b"]
+
+    def test_save_and_load(self, index, tmp_path):
+        path = tmp_path / "lexical" / "mango_kb.json"
+        index.save(path)
+        loaded = BM25Index.load(path)
+        assert len(loaded) == 3
+        assert [h.id for h in loaded.search("password")] == [h.id for h in index.search("password")]
+
+    def test_missing_file_loads_empty(self, tmp_path):
+        assert len(BM25Index.load(tmp_path / "missing.json")) == 0
+
+    def test_other_tokenizer_refused(self, index, tmp_path):
+        path = tmp_path / "mango_kb.json"
+        index.tokenizer = "other"
+        index.save(path)
+        with pytest.raises(TokenizerMismatchError):
+            BM25Index.load(path)
+
+
+class TestReciprocalRankFusion:
+    """Test RRF merging"""
+
+    def test_agreement_wins(self):
+        vector = [SearchHit("x", 0.9, {}), SearchHit("y", 0.8, {})]
+        lexical = [SearchHit("y", 12.0, {}), SearchHit("z", 3.0, {})]
+        fused = reciprocal_rank_fusion([vector, lexical], limit=3)
+        assert [hit.id for hit in fused] == ["y", "x", "z"]
+
+    def test_limit(self):
+        hits = [SearchHit(i, 1.0, {}) for i in range(10)]
+        assert len(reciprocal_rank_fusion([hits], limit=3)) == 3
@@ -218,3 +218,535 @@ class TestErrorHandling:
             assert True
         except UnicodeDecodeError:
             pytest.fail("Should handle UnicodeDecodeError gracefully")
+
+# ==========================================
+# 🧪 CATEGORY 6: INCREMENTAL INGESTION
+# ==========================================
+
+from scripts import ingest_real_data as ingest
+from app.way_rag.digest import ExtractiveSummarizer, create_summarizer
+
+
+def _commit_all(repo, message):
+    repo.git.add(A=True)
+    repo.git.commit("-m", message, "--author", "Test <test@example.com>")
+    return repo.head.commit.hexsha
+
+
+class TestIncrementalIngestion:
+    """Test git-diff-based change detection and stable IDs"""
+
+    @pytest.fixture
+    def kb_repo(self, tmp_path):
+        repo = Repo.init(tmp_path)
+        with repo.config_writer() as cw:
+            cw.set_value("user", "name", "Test")
+            cw.set_value("user", "email", "test@example.com")
+        (tmp_path / "docs").mkdir()
+        (tmp_path / "docs" / "po.md").write_text("# PO", encoding="utf-8")
+        (tmp_path / "docs" / "ap.md").write_text("# AP", encoding="utf-8")
+        (tmp_path / "logo.png").write_bytes(b"\x89PNG")
+        return repo
+
+    def test_point_id_is_stable(self):
+        """Same path gives the same ID, regardless of position in the corpus"""
+        assert ingest.point_id("docs/po.md") == ingest.point_id("docs/po.md")
+        assert ingest.point_id("docs/po.md") != ingest.point_id("docs/ap.md")
+
+    def test_diff_reports_changed_and_removed(self, kb_repo, tmp_path):
+        old_sha = _commit_all(kb_repo, "initial")
+
+        (tmp_path / "docs" / "po.md").write_text("# PO v2", encoding="utf-8")
+        (tmp_path / "docs" / "ap.md").unlink()
+        (tmp_path / "docs" / "ic.md").write_text("# IC", encoding="utf-8")
+        (tmp_path / "logo.png").write_bytes(b"\x89PNG2")
+        new_sha = _commit_all(kb_repo, "update")
+
+        changed, removed = ingest.diff_markdown(kb_repo, old_sha, new_sha)
+        assert sorted(changed) == ["docs/ic.md", "docs/po.md"]
+        assert removed == ["docs/ap.md"]
+
+    def test_rename_is_delete_plus_add(self, kb_repo, tmp_path):
+        old_sha = _commit_all(kb_repo, "initial")
+        (tmp_path / "docs" / "po.md").rename(tmp_path / "docs" / "purchase.md")
+        new_sha = _commit_all(kb_repo, "rename")
+
+        changed, removed = ingest.diff_markdown(kb_repo, old_sha, new_sha)
+        assert changed == ["docs/purchase.md"]
+        assert removed == ["docs/po.md"]
+
+    def test_state_roundtrip(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ingest, "STATE_FILE", tmp_path / "state.json")
+        assert ingest.load_state() == {}
+        ingest.save_state("abc123")
+        assert ingest.load_state()["commit"] == "abc123"
+
+    def test_local_source_edits_are_changes(self, tmp_path, monkeypatch):
+        """Local sources are outside the reference repo's diff, so their hashes are tracked in the state"""
+        kb = tmp_path / "kb.md"
+        kb.write_text("# KB", encoding="utf-8")
+        monkeypatch.setattr(ingest, "STATE_FILE", tmp_path / "state.json")
+        monkeypatch.setattr(ingest, "LOCAL_SOURCES", {"local/kb.md": kb, "local/gone.json": tmp_path / "gone.json"})
+
+        hashes = ingest.local_source_hashes()
+        assert list(hashes) == ["local/kb.md"]
+        assert ingest.diff_local_sources({}, hashes) == (["local/kb.md"], [])
+
+        ingest.save_state("abc123", hashes)
+        state = ingest.load_state()
+        assert ingest.diff_local_sources(state, ingest.local_source_hashes()) == ([], [])
+
+        kb.write_text("# KB v2", encoding="utf-8")
+        assert ingest.diff_local_sources(state, ingest.local_source_hashes()) == (["local/kb.md"], [])
+
+        kb.unlink()
+        assert ingest.diff_local_sources(state, ingest.local_source_hashes()) == ([], ["local/kb.md"])
+
+# ==========================================
+# 🧪 CATEGORY 7: CHUNKING
+# ==========================================
+
+from app.way_rag.chunking import chunk_markdown, split_sections, estimate_tokens
+
+KB_MARKDOWN = Path(__file__).resolve().parents[2] / "KNOWLEDGE_BASE.md"
+
+
+class TestChunking:
+    """Test heading-aware chunking of knowledge-base markdown"""
+
+    def test_sections_follow_heading_hierarchy(self):
+        md = "# Doc\n\n## PO\n\n### FAQ\n\ntext\n\n## AP\n\nmore"
+        sections = split_sections(md)
+        assert [s["headings"] for s in sections] == [["Doc", "PO", "FAQ"], ["Doc", "AP"]]
+
+    def test_headings_inside_code_fences_ignored(self):
+        md = "## Setup\n\n```bash\n# not a heading\n```\n"
+        sections = split_sections(md)
+        assert len(sections) == 1
+        assert "# not a heading" in "\n".join(sections[0]["lines"])
+
+    def test_faq_pairs_become_own_chunks(self):
+        md = (
+            "## 4. Purchase Order (PO)\n\n### FAQ\n\n"
+            "**Q:** PR กับ PO ต่างกันอย่างไร?  \n**A:** PR คือใบขอซื้อ PO คือใบสั่งซื้อ\n\n"
+            "**Q:** รับสินค้าไม่ครบได้ไหม?  \n**A:** ได้ครับ\n"
+        )
+        chunks = chunk_markdown(md)
+        faqs = [c for c in chunks if c["kind"] == "faq"]
+        assert len(faqs) == 2
+        assert faqs[0]["question"] == "PR กับ PO ต่างกันอย่างไร?"
+        assert faqs[1]["answer"] == "ได้ครับ"
+        assert faqs[0]["section"] == "4. Purchase Order (PO) > FAQ"
+        assert faqs[0]["text"].startswith("4. Purchase Order (PO) > FAQ")
+
+    def test_long_section_respects_budget_with_overlap(self):
+        paragraphs = [f"Paragraph {i} " + "word " * 40 for i in range(10)]
+        md = "## Long\n\n" + "\n\n".join(paragraphs)
+        chunks = chunk_markdown(md, max_tokens=120, overlap_tokens=60)
+
+        assert len(chunks) > 1
+        for chunk in chunks:
+            body = chunk["text"].split("\n\n", 1)[1]
+            assert estimate_tokens(body) <= 120
+        # Overlap: the last paragraph of a chunk opens the next one
+        first_tail = chunks[0]["text"].splitlines()[-1]
+        assert first_tail in chunks[1]["text"]
+
+    def test_knowledge_base_faq_coverage(self):
+        """Every **Q:** in KNOWLEDGE_BASE.md yields exactly one FAQ chunk"""
+        md = KB_MARKDOWN.read_text(encoding="utf-8")
+        chunks = chunk_markdown(md)
+        assert sum(c["kind"] == "faq" for c in chunks) == md.count("**Q:**")
+        assert all(c["text"].strip() for c in chunks)
+
+# ==========================================
+# 🧪 CATEGORY 8: STREAMING PIPELINE
+# ==========================================
+
+class RecordingModel:
+    """Fake fastembed model that records how it was called"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts, batch_size=256, parallel=None):
+        texts = list(texts)
+        self.calls.append({"count": len(texts), "batch_size": batch_size, "parallel": parallel})
+        for _ in texts:
+            yield [0.1] * VECTOR_SIZE
+
+
+class FakeStore:
+    """Fake vector store that records upsert batches and can fail on demand"""
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    def upsert(self, points):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("qdrant unavailable")
+        self.batches.append(list(points))
+
+
+class TestStreamingPipeline:
+    """Test the read -> chunk -> embed -> upload pipeline"""
+
+    DOCS = ["po.md", "ap.md", "ic.md", "empty.md"]
+
+    @pytest.fixture
+    def docs(self, tmp_path):
+        for name in ["po.md", "ap.md", "ic.md"]:
+            (tmp_path / name).write_text(
+                f"## {name}\n\nbody\n\n### FAQ\n\n**Q:** q?  \n**A:** a\n", encoding="utf-8"
+            )
+        (tmp_path / "empty.md").write_text("   ", encoding="utf-8")
+        return tmp_path
+
+    @pytest.fixture
+    def pipeline(self, monkeypatch, tmp_path):
+        model = RecordingModel()
+        store = FakeStore()
+        monkeypatch.setattr(ingest, "embedding_model", model)
+        monkeypatch.setattr(ingest, "store", store)
+        monkeypatch.setattr(ingest, "EMBED_BATCH_SIZE", 4)
+        monkeypatch.setattr(ingest, "UPLOAD_BATCH_SIZE", 2)
+        monkeypatch.setattr(ingest, "QUEUE_SIZE", 2)
+        monkeypatch.setattr(ingest.time, "sleep", lambda s: None)
+        checkpoint = ingest.Checkpoint(tmp_path / "ckpt.jsonl", "abc", "full")
+        return model, store, checkpoint
+
+    def test_single_streamed_embed_call(self, docs, pipeline):
+        model, store, checkpoint = pipeline
+        uploaded = ingest.run_pipeline(str(docs), self.DOCS, checkpoint)
+
+        assert len(model.calls) == 1
+        assert model.calls[0]["count"] == uploaded == 6
+        assert model.calls[0]["batch_size"] == 4
+
+    def test_uploads_in_bounded_batches(self, docs, pipeline):
+        model, store, checkpoint = pipeline
+        ingest.run_pipeline(str(docs), self.DOCS, checkpoint)
+
+        assert all(len(b) <= 2 for b in store.batches)
+        points = [p for b in store.batches for p in b]
+        assert {p.payload["path"] for p in points} == {"po.md", "ap.md", "ic.md"}
+        assert len({p.id for p in points}) == len(points) == 6
+        assert checkpoint.done == set(self.DOCS)
+
+    def test_small_runs_stay_in_process(self, docs, pipeline, monkeypatch):
+        """Spawning worker processes is skipped when there is less than two batches of work"""
+        model, store, checkpoint = pipeline
+        monkeypatch.setattr(ingest, "EMBED_BATCH_SIZE", 64)
+        ingest.run_pipeline(str(docs), ["po.md"], checkpoint)
+        assert model.calls[0]["parallel"] is None
+
+    def test_few_long_docs_use_workers(self, tmp_path, pipeline, monkeypatch):
+        """The in-process decision counts chunks, not documents"""
+        model, store, checkpoint = pipeline
+        monkeypatch.setattr(ingest, "EMBED_PARALLEL", 0)
+        body = "\n\n".join(f"## Section {i}\n\ntext {i}" for i in range(10))
+        (tmp_path / "long.md").write_text(body, encoding="utf-8")
+        uploaded = ingest.run_pipeline(str(tmp_path), ["long.md"], checkpoint)
+        assert uploaded >= 8
+        assert model.calls[0]["parallel"] == 0
+
+    def test_retry_with_backoff(self, docs, pipeline):
+        model, store, checkpoint = pipeline
+        store.fail_times = 2
+        ingest.run_pipeline(str(docs), ["po.md"], checkpoint)
+        assert len([p for b in store.batches for p in b]) == 2
+
+    def test_failure_keeps_checkpoint_for_resume(self, docs, pipeline, monkeypatch, tmp_path):
+        model, store, checkpoint = pipeline
+        store.fail_times = 100
+        with pytest.raises(ConnectionError):
+            ingest.run_pipeline(str(docs), self.DOCS, checkpoint)
+
+        # Only the empty file finished; a new run resumes instead of restarting
+        resumed = ingest.Checkpoint(tmp_path / "ckpt.jsonl", "abc", "full")
+        assert resumed.resuming
+        assert resumed.done == {"empty.md"}
+
+        store.fail_times = 0
+        ingest.run_pipeline(str(docs), self.DOCS, resumed)
+        assert resumed.done == set(self.DOCS)
+
+    def test_embed_failure_stops_the_reader(self, tmp_path, pipeline, monkeypatch):
+        """A failing embed stage must not leave the reader blocked on a full queue"""
+        import threading
+        model, store, checkpoint = pipeline
+        names = [f"doc{i}.md" for i in range(20)]
+        for name in names:
+            (tmp_path / name).write_text(f"## {name}\n\nbody\n", encoding="utf-8")
+
+        def failing_embed(texts):
+            next(iter(texts))
+            raise RuntimeError("embedding failed")
+        monkeypatch.setattr(ingest, "embed_texts", failing_embed)
+
+        errors = []
+        worker = threading.Thread(
+            target=lambda: errors.append(pytest.raises(RuntimeError, ingest.run_pipeline, str(tmp_path), names, checkpoint)),
+            daemon=True,
+        )
+        worker.start()
+        worker.join(timeout=10)
+        assert not worker.is_alive()
+        assert errors
+
+    def test_checkpoint_for_other_commit_is_discarded(self, tmp_path):
+        path = tmp_path / "ckpt.jsonl"
+        old = ingest.Checkpoint(path, "old", "full")
+        old.mark_done("po.md")
+
+        fresh = ingest.Checkpoint(path, "new", "full")
+        assert not fresh.resuming
+        assert fresh.done == set()
+
+
+# ==========================================
+# 🧪 CATEGORY 9: LEXICAL INDEX
+# ==========================================
+
+class TestLexicalIndex:
+    """Test the BM25 index built next to the vector store"""
+
+    def test_kb_entries_keep_keywords(self):
+        records = ingest.chunk_file("", "local/knowledge_base.json")
+        assert records
+        payload = records[0][1]
+        assert payload["kind"] == "entry"
+        assert payload["keywords"]
+        assert payload["path"] == "local/knowledge_base.json"
+
+    def test_update_replaces_changed_paths(self, tmp_path, monkeypatch):
+        from app.way_rag.lexical import BM25Index
+        monkeypatch.setattr(ingest, "LEXICAL_INDEX_PATH", tmp_path / "lexical.json")
+        (tmp_path / "po.md").write_text("## PO\n\nPurchase order MAT-001\n", encoding="utf-8")
+        ingest.update_lexical_index(str(tmp_path), ["po.md", "local/knowledge_base.json"], [], rebuild=True)
+
+        index = BM25Index.load(tmp_path / "lexical.json")
+        assert index.search("MAT-001")[0].payload["path"] == "po.md"
+        assert index.search("password")[0].payload["path"] == "local/knowledge_base.json"
+
+        (tmp_path / "po.md").write_text("## PO\n\nPurchase order only\n", encoding="utf-8")
+        ingest.update_lexical_index(str(tmp_path), ["po.md"], [], rebuild=False)
+        index = BM25Index.load(tmp_path / "lexical.json")
+        assert index.search("MAT-001") == []
+        assert index.search("password")
+
+    def test_update_rebuilds_other_tokenizer(self, tmp_path, monkeypatch):
+        from app.way_rag.lexical import BM25Index
+        monkeypatch.setattr(ingest, "LEXICAL_INDEX_PATH", tmp_path / "lexical.json")
+        monkeypatch.setattr(ingest, "local_sources", lambda: [])
+        (tmp_path / "po.md").write_text("## PO\n\nPurchase order MAT-001\n", encoding="utf-8")
+        (tmp_path / "gr.md").write_text("## GR\n\nGoods receipt MIGO\n", encoding="utf-8")
+        BM25Index(tokenizer="other").save(tmp_path / "lexical.json")
+
+        ingest.update_lexical_index(str(tmp_path), ["po.md"], [], rebuild=False)
+        index = BM25Index.load(tmp_path / "lexical.json")
+        assert index.search("MIGO")[0].payload["path"] == "gr.md"
+
+
+# ==========================================
+# 🧪 CATEGORY 10: CHUNK DIGESTS
+# ==========================================
+
+class CountingSummarizer(ExtractiveSummarizer):
+    """Local summarizer that counts the texts it was asked to digest"""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def summarize(self, texts):
+        self.texts.extend(texts)
+        return super().summarize(texts)
+
+
+class TestDigests:
+    """Test the optional ingest-time digest stage"""
+
+    @pytest.fixture
+    def summarizer(self, monkeypatch, tmp_path):
+        summarizer = CountingSummarizer()
+        monkeypatch.setattr(ingest, "summarizer", summarizer)
+        monkeypatch.setattr(ingest, "digest_cache", {})
+        monkeypatch.setattr(ingest, "digest_used", set())
+        monkeypatch.setattr(ingest, "DIGEST_CACHE_FILE", tmp_path / "digests.json")
+        return summarizer
+
+    @pytest.fixture
+    def doc(self, tmp_path):
+        (tmp_path / "po.md").write_text(
+            "## PO\n\nCreate the purchase order in ME21N. Approval follows.\n\n"
+            "- Vendor must exist\n- Plant is required\n\n"
+            "### FAQ\n\n**Q:** Who approves?  \n**A:** The purchasing manager.\n",
+            encoding="utf-8",
+        )
+        return tmp_path
+
+    def test_faq_digest_is_the_answer(self):
+        digest = ExtractiveSummarizer().summarize(["PO > FAQ\n\nQ: Who approves?\nA: The purchasing manager."])
+        assert digest == ["The purchasing manager."]
+
+    def test_digest_keeps_facts_within_budget(self):
+        text = "PO\n\nCreate the order in ME21N. Then wait.\n\n- Vendor must exist\n- Plant is required"
+        digest = ExtractiveSummarizer(max_chars=60).summarize([text])[0]
+        assert digest.startswith("Create the order in ME21N.")
+        assert "- Vendor must exist" in digest
+        assert len(digest) <= 60
+
+    def test_digests_stored_in_payload(self, summarizer, doc):
+        records = ingest.chunk_file(str(doc), "po.md")
+        assert records and all(payload.get("digest") for _, payload in records)
+        faq = [payload for _, payload in records if payload["kind"] == "faq"][0]
+        assert faq["digest"] == "The purchasing manager."
+
+    def test_digests_generated_once(self, summarizer, doc):
+        ingest.chunk_file(str(doc), "po.md")
+        count = len(summarizer.texts)
+        ingest.save_digest_cache()
+        ingest.load_digest_cache()
+        records = ingest.chunk_file(str(doc), "po.md")
+        assert len(summarizer.texts) == count
+        assert all(payload.get("digest") for _, payload in records)
+
+    def test_disabled_by_default(self, doc, monkeypatch):
+        monkeypatch.setattr(ingest, "summarizer", None)
+        records = ingest.chunk_file(str(doc), "po.md")
+        assert not any("digest" in payload for _, payload in records)
+
+    def test_unknown_summarizer(self):
+        with pytest.raises(ValueError):
+            create_summarizer("gpt")
+
+
+# ==========================================
+# 🧪 CATEGORY 11: DEPARTMENT / MODULE PAYLOAD
+# ==========================================
+
+class TestScopeFields:
+    """Test the payload fields used for department-scoped searches"""
+
+    def test_kb_entries_keep_department(self):
+        records = ingest.chunk_file("", "local/knowledge_base.json")
+        assert {payload["department"] for _, payload in records} == {"IT", "HR", "Accounting"}
+
+    def test_markdown_department_and_module(self, tmp_path):
+        (tmp_path / "ap.md").write_text(
+            "# KB\n\n## 5. Accounts Payable (AP)\n\n### FAQ\n\n"
+            "**Q:** How do I record an invoice?\n**A:** Use the AP invoice screen.\n",
+            encoding="utf-8",
+        )
+        records = ingest.chunk_file(str(tmp_path), "ap.md")
+        payload = records[0][1]
+        assert payload["department"] == "Accounting"
+        assert payload["module"] == "AP"
+
+    def test_no_module_without_code(self):
+        assert ingest.scope_fields("intro.md", "Intro") == {}
+
+    def test_department_only_where_curated(self, tmp_path):
+        """Keyword guesses ("hr" in "through", "ลา" in "เวลา") never label chunks"""
+        (tmp_path / "po.md").write_text(
+            "# KB\n\n## 4. Purchase Order (PO)\n\n"
+            "Approve the PO through the workflow; ใช้เวลาอนุมัติไม่นาน, set the invoice terms.\n",
+            encoding="utf-8",
+        )
+        records = ingest.chunk_file(str(tmp_path), "po.md")
+        assert records
+        assert all("department" not in payload for _, payload in records)
+        assert {payload["module"] for _, payload in records} == {"PO"}
+
+    def test_department_by_path(self, monkeypatch):
+        monkeypatch.setattr(ingest, "department_scopes", {"paths": {"hr/*.md": "HR"}, "modules": {}})
+        assert ingest.scope_fields("hr/leave.md", "Leave policy") == {"department": "HR"}
+        assert ingest.scope_fields("it/vpn.md", "VPN") == {}
+
+
+# ==========================================
+# 🧪 CATEGORY 12: FAQ DIRECT-ANSWER INDEX
+# ==========================================
+
+class TestFAQIndex:
+    """Test the separate index of FAQ questions"""
+
+    def test_questions_indexed_with_answers(self, tmp_path, monkeypatch):
+        from app.way_rag.vector_store import NumpyVectorStore
+        repo = tmp_path / "repo"
+        repo.mkdir()
+        (repo / "po.md").write_text(
+            "# PO\n\nPurchase orders.\n\n### FAQ\n\n**Q:** Who approves a PO?\n**A:** The purchasing manager.\n",
+            encoding="utf-8",
+        )
+        model = RecordingModel()
+        faq_store = NumpyVectorStore(tmp_path / "faq")
+        monkeypatch.setattr(ingest, "embedding_model", model)
+        monkeypatch.setattr(ingest, "faq_store", faq_store)
+
+        ingest.update_faq_index(str(repo), [], [], rebuild=True)
+
+        payloads = faq_store._payloads
+        assert payloads and all(p["answer"] for p in payloads)
+        po = [p for p in payloads if p["path"] == "po.md"]
+        assert [(p["question"], p["answer"]) for p in po] == [("Who approves a PO?", "The purchasing manager.")]
+        # Only the questions are embedded
+        assert model.calls[0]["count"] == len(payloads)
+
+
+# ==========================================
+# 🧪 CATEGORY 13: DEPARTMENT CENTROIDS
+# ==========================================
+
+class TestDepartmentCentroids:
+    """Test the centroids written for the embedding classifier"""
+
+    def test_centroids_from_store(self, tmp_path, monkeypatch):
+        import numpy as np
+        from app.wut_orchestrator import EmbeddingClassifier
+        from app.way_rag.vector_store import NumpyVectorStore
+        from qdrant_client.models import PointStruct
+
+        store = NumpyVectorStore(tmp_path / "index")
+        store.recreate(4)
+        store.upsert([
+            PointStruct(id=i, vector=vector, payload={"department": department})
+            for i, (vector, department) in enumerate([
+                ([1, 0, 0, 0], "IT"), ([0.9, 0.1, 0, 0], "IT"),
+                ([0, 1, 0, 0], "HR"), ([0.1, 0.9, 0, 0], "HR"), ([0, 0, 1, 0], None),
+                # Too few chunks for a centroid of its own
+                ([0, 0, 0.9, 0.1], "Accounting"),
+                # Labels left by keyword guessing are not curated departments
+                ([0, 0, 0, 1], "General"),
+            ])
+        ])
+        store.finalize()
+        monkeypatch.setattr(ingest, "store", store)
+        monkeypatch.setattr(ingest, "CENTROIDS_PATH", tmp_path / "centroids.json")
+        monkeypatch.setattr(ingest, "CENTROID_MIN_CHUNKS", 2)
+
+        ingest.update_department_centroids()
+
+        classifier = EmbeddingClassifier.load(tmp_path / "centroids.json")
+        assert classifier.departments == ["HR", "IT"]
+        assert classifier.counts == {"IT": 2, "HR": 2, "Accounting": 1}
+        assert classifier.classify(np.array([1, 0, 0, 0]))["department"] == "IT"
+
+    def test_stale_centroids_removed_when_fit_fails(self, tmp_path, monkeypatch):
+        from app.way_rag.vector_store import NumpyVectorStore
+        from qdrant_client.models import PointStruct
+
+        store = NumpyVectorStore(tmp_path / "index")
+        store.recreate(4)
+        store.upsert([PointStruct(id=0, vector=[1, 0, 0, 0], payload={"department": "IT"})])
+        store.finalize()
+        centroids = tmp_path / "centroids.json"
+        centroids.write_text("{}", encoding="utf-8")
+        monkeypatch.setattr(ingest, "store", store)
+        monkeypatch.setattr(ingest, "CENTROIDS_PATH", centroids)
+
+        ingest.update_department_centroids()
+        assert not centroids.exists()
@@ -0,0 +1,156 @@
+"""
+Session store tests
+In-memory LRU with SQLite spill, TTL expiry and memory caps (in-memory SQLite, no files)
+"""
+import asyncio
+import threading
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlalchemy.pool import StaticPool
+from app.models import ChatSession
+from app.sessions import SessionStore
+
+
+@pytest.fixture
+def db_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def msg(content, role="user"):
+    return {"role": role, "content": content}
+
+
+class TestSessionStore:
+    """Test the bounded two-tier session store"""
+
+    def test_create_append_get(self, db_engine):
+        store = SessionStore(db_engine)
+        session = store.create([msg("Hello!", "assistant")])
+        store.append(session.id, [msg("reset password"), msg("Use the portal", "assistant")])
+        assert [m["content"] for m in store.get(session.id).messages] == ["Hello!", "reset password", "Use the portal"]
+
+    def test_unknown_session(self, db_engine):
+        assert SessionStore(db_engine).get("missing") is None
+
+    def test_lru_spills_to_sqlite_and_reloads(self, db_engine):
+        store = SessionStore(db_engine, max_sessions=2)
+        first = store.create([msg("first")])
+        store.create([msg("second")])
+        store.create([msg("third")])
+
+        assert store.stats()["in_memory"] == 2
+        assert store.stats()["spilled"] == 1
+        reloaded = store.get(first.id)
+        assert reloaded.messages == [msg("first")]
+        assert store.stats()["loaded"] == 1
+
+    def test_memory_cap(self, db_engine):
+        store = SessionStore(db_engine, max_bytes=1000)
+        sessions = [store.create([msg("x" * 300)]) for _ in range(5)]
+        assert store.stats()["bytes"] <= 1000
+        assert all(store.get(s.id) is not None for s in sessions)
+
+    def test_ttl_expiry_in_both_tiers(self, db_engine, monkeypatch):
+        import app.sessions as sessions
+        now = [1000.0]
+        monkeypatch.setattr(sessions.time, "time", lambda: now[0])
+        store = SessionStore(db_engine, max_sessions=1, ttl_seconds=60)
+        spilled = store.create([msg("a")])
+        in_memory = store.create([msg("b")])
+
+        now[0] += 61
+        assert store.get(in_memory.id) is None
+        assert store.get(spilled.id) is None
+
+    def test_message_cap_keeps_latest(self, db_engine):
+        store = SessionStore(db_engine, max_messages=3)
+        session = store.create()
+        store.append(session.id, [msg(str(i)) for i in range(5)])
+        assert [m["content"] for m in store.get(session.id).messages] == ["2", "3", "4"]
+
+    def test_flush_survives_restart(self, db_engine):
+        store = SessionStore(db_engine)
+        session = store.create([msg("keep me")])
+        store.flush()
+        assert SessionStore(db_engine).get(session.id).messages == [msg("keep me")]
+
+    def test_delete(self, db_engine):
+        store = SessionStore(db_engine, max_sessions=1)
+        session = store.create([msg("a")])
+        store.create([msg("b")])  # spills the first one
+        store.delete(session.id)
+        assert store.get(session.id) is None
+
+
+class TestSessionStoreAsync:
+    """Test the event-loop API: SQLite off the loop, per-ID locks, periodic purge"""
+
+    def test_create_does_not_purge(self, db_engine, monkeypatch):
+        store = SessionStore(db_engine)
+        monkeypatch.setattr(store, "_purge_rows", lambda cutoff: pytest.fail("purged on create"))
+        asyncio.run(store.create_async([msg("a")]))
+
+    def test_misses_load_on_the_store_thread(self, db_engine):
+        store = SessionStore(db_engine, max_sessions=1)
+        threads = []
+        load = store._load
+        store._load = lambda session_id: threads.append(threading.current_thread().name) or load(session_id)
+
+        async def run():
+            first = await store.create_async([msg("first")])
+            await store.create_async([msg("second")])  # spills the first one
+            assert await store.get_async("missing") is None
+            return await store.get_async(first.id)
+
+        assert asyncio.run(run()).messages == [msg("first")]
+        assert threads and all(name.startswith("sessions") for name in threads)
+
+    def test_session_reachable_while_spilling(self, db_engine):
+        store = SessionStore(db_engine, max_sessions=1)
+        first = store.create([msg("first")])
+        store._spilling[first.id] = store._sessions.pop(first.id)
+        store._bytes -= first.size
+        assert store.get(first.id) is first
+
+    def test_lock_survives_spill_and_reload(self, db_engine):
+        """A turn waiting on the lock sees the messages appended by the turn before it"""
+        store = SessionStore(db_engine, max_sessions=1)
+
+        async def turn(session_id, text, spill):
+            async with store.lock(session_id):
+                state = await store.get_async(session_id)
+                seen = [m["content"] for m in state.messages]
+                await asyncio.sleep(0)
+                await store.append_async(session_id, [msg(text)])
+                if spill:
+                    await store.create_async()  # evicts the session, the next turn reloads it
+                return seen
+
+        async def run():
+            session = await store.create_async()
+            return await asyncio.gather(turn(session.id, "one", True), turn(session.id, "two", False))
+
+        first, second = asyncio.run(run())
+        assert first == []
+        assert second == ["one"]
+
+    def test_purge_periodically(self, db_engine, monkeypatch):
+        import app.sessions as sessions
+        now = [1000.0]
+        monkeypatch.setattr(sessions.time, "time", lambda: now[0])
+        store = SessionStore(db_engine, max_sessions=1, ttl_seconds=60, purge_interval=0)
+        spilled = store.create([msg("a")])
+        store.create([msg("b")])
+        now[0] += 61
+
+        async def run():
+            task = asyncio.create_task(store.purge_periodically())
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+        asyncio.run(run())
+        assert store.stats()["in_memory"] == 0
+        with Session(db_engine) as db:
+            assert db.exec(select(ChatSession)).first() is None
@@ -0,0 +1,102 @@
+"""
+Conversation summary tests
+Prefix hashing, cached rolling summaries and background updates (no LLM needed)
+"""
+import asyncio
+from app.way_rag.summary import ConversationSummarizer, prefix_hashes
+
+
+def conversation(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg {i}"} for i in range(n)]
+
+
+class RecordingSummarize:
+    """Stand-in for the LLM: appends the covered message contents to the summary"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous, messages):
+        self.calls.append((previous, [m["content"] for m in messages]))
+        parts = ([previous] if previous else []) + [m["content"] for m in messages]
+        return " | ".join(parts)
+
+
+class TestPrefixHashes:
+    def test_prefixes_share_hashes(self):
+        full = prefix_hashes(conversation(5))
+        assert prefix_hashes(conversation(3)) == full[:3]
+
+    def test_role_and_content_matter(self):
+        a = prefix_hashes([{"role": "user", "content": "hi"}])
+        b = prefix_hashes([{"role": "assistant", "content": "hi"}])
+        assert a != b
+
+
+class TestConversationSummarizer:
+    """Test summary lookup and incremental updates"""
+
+    def test_short_history_untouched(self):
+        summarizer = ConversationSummarizer(RecordingSummarize(), trigger_messages=8)
+        history = conversation(8)
+        assert summarizer.condense(history) == (None, history)
+
+    def test_first_long_request_sends_verbatim_and_summarizes_in_background(self):
+        summarize = RecordingSummarize()
+        summarizer = ConversationSummarizer(summarize, trigger_messages=8, keep_recent=4)
+
+        async def run():
+            result = summarizer.condense(conversation(10))
+            await summarizer.wait()
+            return result
+
+        summary, remaining = asyncio.run(run())
+        assert summary is None and len(remaining) == 10
+        assert summarize.calls == [(None, [f"msg {i}" for i in range(6)])]
+
+    def test_summary_extended_incrementally(self):
+        summarize = RecordingSummarize()
+        summarizer = ConversationSummarizer(summarize, trigger_messages=8, keep_recent=4)
+
+        async def run():
+            summarizer.condense(conversation(10))
+            await summarizer.wait()
+            # Two turns later: the cached summary covers msg 0-5, msg 6-7 are new
+            result = summarizer.condense(conversation(12))
+            await summarizer.wait()
+            return result
+
+        summary, remaining = asyncio.run(run())
+        assert summary == "msg 0 | msg 1 | msg 2 | msg 3 | msg 4 | msg 5"
+        assert [m["content"] for m in remaining] == [f"msg {i}" for i in range(6, 12)]
+        assert summarize.calls[1] == (summary, ["msg 6", "msg 7"])
+
+        # The extended summary now covers everything but the recent turns
+        summary, remaining = summarizer.condense(conversation(12))
+        assert summary.endswith("msg 7")
+        assert len(remaining) == 4
+
+    def test_concurrent_requests_share_one_update(self):
+        summarize = RecordingSummarize()
+        summarizer = ConversationSummarizer(summarize, trigger_messages=8, keep_recent=4)
+
+        async def run():
+            summarizer.condense(conversation(10))
+            summarizer.condense(conversation(10))
+            await summarizer.wait()
+
+        asyncio.run(run())
+        assert len(summarize.calls) == 1
+
+    def test_failed_update_is_not_cached(self):
+        async def failing(previous, messages):
+            raise RuntimeError("groq down")
+
+        summarizer = ConversationSummarizer(failing, trigger_messages=2, keep_recent=1)
+
+        async def run():
+            summarizer.condense(conversation(4))
+            await summarizer.wait()
+
+        asyncio.run(run())
+        assert len(summarizer.cache) == 0
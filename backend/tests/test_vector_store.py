@@ -0,0 +1,257 @@
+"""
+Vector store backend tests
+NumPy mmap index and embedded Qdrant local mode (no server needed)
+"""
+import asyncio
+import uuid
+import pytest
+import numpy as np
+from qdrant_client.models import PointStruct
+import app.way_rag.vector_store as vector_store
+from app.way_rag.vector_store import SearchHit, NumpyVectorStore, QdrantVectorStore, create_vector_store
+
+DIM = 8
+
+
+def make_points(n, offset=0):
+    points = []
+    for i in range(n):
+        vec = np.zeros(DIM, dtype=np.float32)
+        vec[(i + offset) % DIM] = 1.0
+        vec[(i + offset + 1) % DIM] = 0.1
+        points.append(PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"doc{i + offset}")),
+            vector=vec.tolist(),
+            payload={"path": f"doc{i + offset}.md", "content": f"content {i + offset}",
+                     "department": "IT" if (i + offset) % 2 == 0 else "HR"},
+        ))
+    return points
+
+
+def unit(i):
+    vec = np.zeros(DIM, dtype=np.float32)
+    vec[i] = 1.0
+    return vec
+
+
+class TestNumpyVectorStore:
+    """Test the in-process memory-mapped index"""
+
+    @pytest.fixture
+    def built(self, tmp_path):
+        store = NumpyVectorStore(tmp_path / "index")
+        store.recreate(DIM)
+        store.upsert(make_points(4))
+        store.upsert(make_points(2, offset=4))
+        store.finalize()
+        return store
+
+    def test_missing_index_searches_empty(self, tmp_path):
+        store = NumpyVectorStore(tmp_path / "none")
+        assert not store.exists()
+        assert asyncio.run(store.search(unit(0))) == []
+
+    def test_top_k_ordered_by_score(self, built):
+        hits = built.search_sync(unit(2), limit=2)
+        assert [h.payload["path"] for h in hits] == ["doc2.md", "doc1.md"]
+        assert hits[0].score > hits[1].score
+        assert hits[0].score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+
+    def test_with_vectors(self, built):
+        hit = built.search_sync(unit(2), limit=1, with_vectors=True)[0]
+        assert hit.vector.shape == (DIM,)
+        assert hit.vector[2] > 0.99
+        assert built.search_sync(unit(2), limit=1)[0].vector is None
+
+    def test_filtered_search_scores_matching_rows(self, built):
+        hits = built.search_sync(unit(2), limit=2, filters={"department": "HR"})
+        assert [h.payload["path"] for h in hits] == ["doc1.md", "doc3.md"]
+        assert hits[0].score == pytest.approx(0.1 / np.sqrt(1.01), rel=1e-4)
+        assert built.search_sync(unit(2), limit=2, filters={"department": "Legal"}) == []
+
+    def test_iter_vectors(self, built):
+        rows = list(built.iter_vectors(batch_size=4))
+        assert len(rows) == 6
+        assert rows[2][1]["path"] == "doc2.md"
+        assert rows[2][0][2] > 0.99
+
+    def test_matrix_is_memory_mapped(self, built):
+        assert isinstance(built._matrix, np.memmap)
+        assert built._matrix.shape == (6, DIM)
+
+    def test_other_process_view_sees_finalized_index(self, built):
+        """A second store on the same path (another worker) maps the same file"""
+        reader = NumpyVectorStore(built.path)
+        assert [h.id for h in reader.search_sync(unit(5), limit=1)] == [built._ids[5]]
+
+    def test_float16_index(self, tmp_path):
+        store = NumpyVectorStore(tmp_path / "index16", dtype="float16")
+        store.recreate(DIM)
+        store.upsert(make_points(3))
+        store.finalize()
+        assert store._matrix.dtype == np.float16
+        assert store.search_sync(unit(1), limit=1)[0].payload["path"] == "doc1.md"
+
+    def test_rewritten_ids_keep_last_version(self, tmp_path):
+        """Resumed builds may upload a point twice; the last write wins"""
+        store = NumpyVectorStore(tmp_path / "index")
+        store.recreate(DIM)
+        store.upsert(make_points(2))
+        replacement = make_points(1)
+        replacement[0].payload["content"] = "v2"
+        store.upsert(replacement)
+        store.finalize()
+
+        assert len(store._ids) == 2
+        hit = store.search_sync(unit(0), limit=1)[0]
+        assert hit.payload["content"] == "v2"
+
+    def test_rebuild_swaps_atomically(self, built):
+        built.recreate(DIM)
+        built.upsert(make_points(1, offset=7))
+        # Readers keep the previous index until finalize()
+        assert len(built._ids) == 6
+        built.finalize()
+        assert [h.payload["path"] for h in built.search_sync(unit(7), limit=5)] == ["doc7.md"]
+
+    def test_index_version_roundtrip(self, built):
+        assert asyncio.run(built.index_version()) is None
+        built.set_index_version("abc-1")
+        assert asyncio.run(built.index_version()) == "abc-1"
+        # The marker does not disturb the index itself
+        built.reload()
+        assert built.search_sync(unit(5), limit=1)[0].payload["path"] == "doc5.md"
+
+    def test_no_incremental_support(self, built):
+        assert not built.supports_incremental
+        with pytest.raises(NotImplementedError):
+            built.delete_paths(["doc1.md"])
+
+
+class TestQdrantLocalStore:
+    """Test embedded Qdrant local mode through the same interface"""
+
+    def test_roundtrip(self, tmp_path):
+        store = QdrantVectorStore("test_kb", path=str(tmp_path / "qdrant"))
+        store.recreate(DIM)
+        assert store.exists()
+        store.upsert(make_points(4))
+        store.delete_paths(["doc3.md"])
+
+        hits = asyncio.run(store.search(unit(3).tolist(), limit=4))
+        assert "doc3.md" not in [h.payload["path"] for h in hits]
+        assert asyncio.run(store.search(unit(1).tolist(), limit=1))[0].payload["path"] == "doc1.md"
+        scoped = asyncio.run(store.search(unit(1).tolist(), limit=4, filters={"department": "IT"}))
+        assert sorted(h.payload["path"] for h in scoped) == ["doc0.md", "doc2.md"]
+        assert sorted(p["path"] for _, p in store.iter_vectors(batch_size=2)) == ["doc0.md", "doc1.md", "doc2.md"]
+
+        assert asyncio.run(store.index_version()) is None
+        store.set_index_version("abc-1")
+        assert asyncio.run(store.index_version()) == "abc-1"
+        store.close()
+
+
+class FakeAsyncQdrant:
+    """Records AsyncQdrantClient construction and queries"""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.options = kwargs
+        self.queries = []
+        self.filters = []
+        self.closed = False
+        FakeAsyncQdrant.instances.append(self)
+
+    async def query_points(self, collection_name, query, limit=3, query_filter=None, **kwargs):
+        self.queries.append((collection_name, limit))
+        self.filters.append(query_filter)
+
+        class Result:
+            points = [SearchHit("p1", 0.9, {"path": "doc1.md"})]
+        return Result()
+
+    async def close(self):
+        self.closed = True
+
+
+class TestQdrantAsyncSearch:
+    """Test that server searches use the async client (no executor thread)"""
+
+    @pytest.fixture
+    def store(self, monkeypatch):
+        FakeAsyncQdrant.instances = []
+        monkeypatch.setattr(vector_store, "AsyncQdrantClient", FakeAsyncQdrant)
+        monkeypatch.setenv("QDRANT_PREFER_GRPC", "true")
+        monkeypatch.setenv("QDRANT_POOL_SIZE", "4")
+        return create_vector_store("kb", kind="qdrant")
+
+    def test_search_uses_async_client(self, store, monkeypatch):
+        def no_threads(*args, **kwargs):
+            raise AssertionError("search must not use a worker thread")
+        monkeypatch.setattr(vector_store.asyncio, "to_thread", no_threads)
+
+        async def run():
+            hits = await store.search(unit(1).tolist(), limit=2)
+            await store.search(unit(2).tolist(), limit=2)
+            await store.aclose()
+            return hits
+
+        hits = asyncio.run(run())
+        assert hits[0].payload["path"] == "doc1.md"
+        # One lazily created client is reused, then closed
+        assert len(FakeAsyncQdrant.instances) == 1
+        client = FakeAsyncQdrant.instances[0]
+        assert client.queries == [("kb", 2), ("kb", 2)]
+        assert client.closed
+
+    def test_filters_sent_as_qdrant_filter(self, store):
+        asyncio.run(store.search(unit(1).tolist(), filters={"department": "IT"}))
+        asyncio.run(store.search(unit(1).tolist()))
+        scoped, unscoped = FakeAsyncQdrant.instances[0].filters
+        assert scoped.must[0].key == "department"
+        assert scoped.must[0].match.value == "IT"
+        assert unscoped is None
+
+    def test_transport_and_pool_from_env(self, store):
+        asyncio.run(store.search(unit(1).tolist()))
+        options = FakeAsyncQdrant.instances[0].options
+        assert options["prefer_grpc"] is True
+        assert options["pool_size"] == 4
+
+
+class TestFactory:
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_vector_store("kb", kind="faiss")
+
+    def test_numpy_from_env(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("VECTOR_INDEX_PATH", str(tmp_path / "idx"))
+        monkeypatch.setenv("VECTOR_INDEX_DTYPE", "float16")
+        store = create_vector_store("kb", kind="numpy")
+        assert isinstance(store, NumpyVectorStore)
+        assert store.dtype == np.float16
+        assert store.path == tmp_path / "idx" / "kb"
+
+    @pytest.mark.parametrize("kind", ["qdrant-local", "numpy"])
+    def test_two_collections_side_by_side(self, kind, tmp_path, monkeypatch):
+        """The KB and the FAQ index share QDRANT_PATH / VECTOR_INDEX_PATH without clobbering each other"""
+        monkeypatch.setenv("QDRANT_PATH", str(tmp_path / "qdrant"))
+        monkeypatch.setenv("VECTOR_INDEX_PATH", str(tmp_path / "idx"))
+        kb = create_vector_store("mango_kb", kind=kind)
+        faq = create_vector_store("mango_faq", kind=kind)
+        for store, points in ((kb, make_points(4)), (faq, make_points(2, offset=5))):
+            store.recreate(DIM)
+            store.upsert(points)
+            store.finalize()
+
+        kb_hits = asyncio.run(kb.search(unit(0).tolist(), limit=10))
+        faq_hits = asyncio.run(faq.search(unit(0).tolist(), limit=10))
+        assert sorted(h.payload["path"] for h in kb_hits) == ["doc0.md", "doc1.md", "doc2.md", "doc3.md"]
+        assert sorted(h.payload["path"] for h in faq_hits) == ["doc5.md", "doc6.md"]
+        assert asyncio.run(kb.search(unit(1).tolist(), limit=1))[0].payload["path"] == "doc1.md"
+
+        # Closing one store leaves the other usable
+        faq.close()
+        assert kb.exists()
+        kb.close()
@@ -0,0 +1,169 @@
+"""
+WUT orchestrator tests
+Keyword classification and decision rules (pure Python, no services needed)
+"""
+import json
+import pytest
+import numpy as np
+from app.wut_orchestrator import WUTClassifier, EmbeddingClassifier, DecisionEngine
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return WUTClassifier()
+
+
+class TestWUTClassifier:
+    """Test department / intent / urgency classification"""
+
+    @pytest.mark.parametrize("text,department", [
+        ("My laptop won't start", "IT"),
+        ("ขอลาพักร้อน 3 วัน", "HR"),
+        ("Where do I send this invoice?", "Accounting"),
+        ("Good morning", "General"),
+        # IT outranks HR when both match
+        ("Forgot my password for the payroll site", "IT"),
+    ])
+    def test_department(self, classifier, text, department):
+        assert classifier.classify(text)["department"] == department
+
+    @pytest.mark.parametrize("text", [
+        "How do I approve a purchase order through the workflow?",
+        "What is the three-way match",
+        "ตั้งค่าสาขากลางอย่างไร",
+    ])
+    def test_substrings_do_not_match_hr(self, classifier, text):
+        assert classifier.classify(text)["department"] != "HR"
+
+    @pytest.mark.parametrize("text,scope", [
+        ("My laptops won't start", "IT"),
+        ("ขอลาพักร้อน 3 วัน", "HR"),
+        ("Where do I send these invoices?", "Accounting"),
+        # Retrieval keywords from knowledge_base.json do not scope
+        ("ขออนุมัติ budget", None),
+        ("Forgot my password for the payroll site", None),
+        ("ใช้เวลาอนุมัติใบสั่งซื้อนานเท่าไหร่", None),
+        ("Good morning", None),
+    ])
+    def test_scope(self, classifier, text, scope):
+        result = classifier.classify_scoped(text)
+        assert result["scope"] == scope
+        assert {k: v for k, v in result.items() if k != "scope"} == classifier.classify(text)
+
+    def test_knowledge_base_keywords(self, classifier):
+        # "email" and "budget" only appear in knowledge_base.json
+        assert classifier.classify("email not syncing")["department"] == "IT"
+        assert classifier.classify("ขออนุมัติ budget")["department"] == "Accounting"
+
+    @pytest.mark.parametrize("text,intent", [
+        ("I need a new monitor", "action_request"),
+        ("How do I reset it?", "question"),
+        ("printer is broken", "problem_report"),
+        ("hello", "question"),
+    ])
+    def test_intent(self, classifier, text, intent):
+        assert classifier.classify(text)["intent"] == intent
+
+    @pytest.mark.parametrize("text,urgency", [
+        ("ด่วนมาก เข้าระบบไม่ได้", "high"),
+        ("please fix soon", "medium"),
+        ("whenever you can", "low"),
+    ])
+    def test_urgency(self, classifier, text, urgency):
+        assert classifier.classify(text)["urgency"] == urgency
+
+    def test_folded_input(self, classifier):
+        assert classifier.classify("LAP\u200bTOP \u0430ND NETWORK")["department"] == "IT"
+
+    def test_batch_matches_single(self, classifier):
+        texts = ["My laptop won't start", "ขอลาพักร้อน", "My laptop won't start", "tax receipt urgent"]
+        assert list(classifier.classify_batch(texts)) == [classifier.classify(t) for t in texts]
+
+    def test_batch_streams_with_bounded_memo(self, classifier):
+        texts = (f"laptop {i % 5}" for i in range(50))
+        results = classifier.classify_batch(texts, memo_size=2)
+        assert next(results)["department"] == "IT"
+        assert sum(1 for _ in results) == 49
+
+    def test_tables_from_data(self, tmp_path):
+        keywords = tmp_path / "keywords.json"
+        keywords.write_text(json.dumps({"department": {"Facilities": ["aircon", "แอร์"]}}), encoding="utf-8")
+        kb = tmp_path / "kb.json"
+        kb.write_text(json.dumps([{"department": "Legal", "keywords": ["contract"]}]), encoding="utf-8")
+        classifier = WUTClassifier(str(keywords), str(kb))
+        assert classifier.classify("แอร์เสีย")["department"] == "Facilities"
+        assert classifier.classify("review this contract")["department"] == "Legal"
+        assert classifier.classify("review this contract")["intent"] == "question"
+
+
+def clusters(spread, n=200, seed=0):
+    """(vector, department) points around three orthogonal directions"""
+    rng = np.random.default_rng(seed)
+    points = []
+    for i, department in enumerate(["IT", "HR", "Accounting"]):
+        center = np.eye(16)[i]
+        for vector in center + rng.normal(scale=spread, size=(n, 16)):
+            points.append((vector, department))
+    return points
+
+
+class TestEmbeddingClassifier:
+    """Test centroid classification and probability calibration"""
+
+    def test_separated_clusters(self):
+        classifier = EmbeddingClassifier.fit(clusters(0.05))
+        result = classifier.classify(np.eye(16)[1] + 0.01)
+        assert result["department"] == "HR"
+        assert result["confidence"] > 0.95
+        assert sum(result["probabilities"].values()) == pytest.approx(1.0)
+
+    def test_calibrated_on_overlapping_clusters(self):
+        # Heavy noise: the fitted temperature must keep confidences modest
+        classifier = EmbeddingClassifier.fit(clusters(1.0))
+        points = clusters(1.0, seed=1)
+        probs = classifier.probabilities(np.stack([v for v, _ in points]))
+        labels = [classifier.departments.index(d) for _, d in points]
+        accuracy = float(np.mean(probs.argmax(axis=1) == labels))
+        assert abs(float(probs.max(axis=1).mean()) - accuracy) < 0.15
+
+    def test_unlabelled_points_ignored(self):
+        points = [(np.eye(4)[0], "IT"), (np.eye(4)[0] + 0.1, "IT"), (np.eye(4)[1], None),
+                  (np.eye(4)[2], "HR"), (np.eye(4)[2] + 0.1, "HR")]
+        classifier = EmbeddingClassifier.fit(points, min_count=2)
+        assert classifier.departments == ["HR", "IT"]
+        with pytest.raises(ValueError):
+            EmbeddingClassifier.fit([(np.eye(4)[1], None)])
+
+    def test_thin_departments_skipped(self):
+        classifier = EmbeddingClassifier.fit(clusters(0.3, n=10) + [(np.eye(16)[10], "Legal")])
+        assert classifier.departments == ["Accounting", "HR", "IT"]
+        assert classifier.counts["Legal"] == 1
+
+    def test_far_query_not_confident(self):
+        # Few chunks per department: in-sample similarities would fit a tiny temperature
+        classifier = EmbeddingClassifier.fit(clusters(1.0, n=5))
+        for far in np.eye(16)[12:]:
+            assert classifier.classify(far)["confidence"] < 0.9
+
+    def test_one_department_cannot_be_calibrated(self):
+        with pytest.raises(ValueError):
+            EmbeddingClassifier.fit([(np.eye(4)[0], "IT"), (np.eye(4)[1], "IT")])
+
+    def test_save_and_load(self, tmp_path):
+        classifier = EmbeddingClassifier.fit(clusters(0.1, n=20))
+        classifier.save(tmp_path / "centroids.json")
+        loaded = EmbeddingClassifier.load(tmp_path / "centroids.json")
+        assert loaded.departments == classifier.departments
+        assert loaded.temperature == classifier.temperature
+        assert EmbeddingClassifier.load(tmp_path / "missing.json") is None
+
+
+class TestDecisionEngine:
+    """Test the business rules"""
+
+    def test_rules(self):
+        engine = DecisionEngine()
+        assert engine.decide(0.9, "Accounting", "action_request") == "CRITICAL_ESCALATE"
+        assert engine.decide(0.5, "IT", "question") == "ESCALATE"
+        assert engine.decide(0.9, "HR", "action_request") == "CREATE_TICKET"
+        assert engine.decide(0.9, "IT", "question") == "AUTO_RESOLVE"
@@ -29,6 +29,9 @@ import {
 } from 'lucide-react';
 import { sanitize } from './utils/sanitize';
 
+// Answer paths (see /api/chat) whose exchange is not resent as history
+const UNSENT_PATHS = new Set(['guard', 'invalid', 'error']);
+
 // Custom Hook for Number Counter
 const useCounter = (end, duration = 2000, start = 0, shouldStart = false) => {
   const [count, setCount] = useState(start);
@@ -175,11 +178,16 @@ const App = () => {
       setRagLogs(prev => [...prev, { time: new Date().toLocaleTimeString(), text: "📡 Connecting to Hybrid Brain..." }]);
       setRagLogs(prev => [...prev, { time: new Date().toLocaleTimeString(), text: "🧠 Sending conversation context (last 6 msgs)..." }]);
 
-      // Prepare messages for API (limit to last 6 for token safety)
-      const messagesToSend = updatedMessages.slice(-6).map(m => ({
-        role: m.role,
-        content: m.content
-      }));
+      // Prepare messages for API (limit to last 6 for token safety).
+      // Refused/failed exchanges are left out: the guard would keep refusing
+      // every later turn that resends a blocked question.
+      const messagesToSend = updatedMessages
+        .filter((m, i, all) => !UNSENT_PATHS.has(m.path) && !UNSENT_PATHS.has(all[i + 1]?.path))
+        .slice(-6)
+        .map(m => ({
+          role: m.role,
+          content: m.content
+        }));
 
       // 1. Send to Backend with full conversation history
       const response = await fetch('/api/chat', {
@@ -197,6 +205,7 @@ const App = () => {
         role: 'assistant',
         content: data.response,
         type: 'answer',
+        path: data.path,
         meta: { confidence: 1.0, doc: 'Real-RAG', action: 'ANSWER' },
         suggestions: [] // Init empty suggestions
       };